@@ -0,0 +1,111 @@
+# ipop-project
+# Copyright 2016, University of Florida
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+# Compares the allocation rate and memory footprint of the slotted CBT with a dict backed
+# copy of the CBT that preceded it. Run from the repository root:
+#   python -m benchmarks.bench_cbt [--count 200000]
+import argparse
+import sys
+import time
+import tracemalloc
+import uuid
+from controller.framework.CBT import CBT
+
+
+class DictCBT():
+    # the CBT as it was before __slots__, priorities and no-response CBTs were added
+    tag_counter = int(uuid.uuid4().hex[:15], base=16)
+
+    class Request():
+        def __init__(self, initiator="", recipient="", action="", params=None):
+            self.initiator = initiator
+            self.recipient = recipient
+            self.action = action
+            self.params = params
+
+    class Response():
+        def __init__(self,):
+            self.status = False
+            self.initiator = None
+            self.recipient = None
+            self.data = None
+
+    def __init__(self, initiator="", recipient="", action="", params=""):
+        self.tag = DictCBT.tag_counter
+        DictCBT.tag_counter = DictCBT.tag_counter + 1
+        self.parent = None
+        self.child_count = 0
+        self.completed = False
+        self.op_type = "Request"
+        self.request = self.Request(initiator, recipient, action, params)
+        self.response = None
+        self.time_create = None
+        self.time_submit = None
+        self.time_complete = None
+        self.time_free = None
+
+    def set_response(self, data="", status=False):
+        self.op_type = "Response"
+        self.response = self.Response()
+        self.response.initiator = self.request.recipient
+        self.response.recipient = self.request.initiator
+        self.response.status = status
+        self.response.data = data
+
+
+def alloc_rate(cbt_class, count):
+    # CBTs created, stamped and responded to per second
+    start = time.perf_counter()
+    for _ in range(count):
+        cbt = cbt_class("LinkManager", "TincanInterface", "TCI_CREATE_LINK", None)
+        cbt.time_create = cbt.time_submit = 0.0
+        cbt.set_response(None, True)
+    return count / (time.perf_counter() - start)
+
+
+def bytes_per_cbt(cbt_class, count):
+    # memory retained by a completed CBT, including its request and response
+    tracemalloc.start()
+    base, _ = tracemalloc.get_traced_memory()
+    live = []
+    for _ in range(count):
+        cbt = cbt_class("LinkManager", "TincanInterface", "TCI_CREATE_LINK", None)
+        cbt.set_response(None, True)
+        live.append(cbt)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # discount the list holding the references
+    return (current - base - sys.getsizeof(live)) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the slotted CBT with a dict backed one")
+    parser.add_argument("--count", type=int, default=200000)
+    count = parser.parse_args().count
+    print("{0:<10}{1:>16}{2:>16}".format("Layout", "CBTs/sec", "Bytes/CBT"))
+    for name, cbt_class in (("dict", DictCBT), ("slots", CBT)):
+        rate = alloc_rate(cbt_class, count)
+        size = bytes_per_cbt(cbt_class, count // 4)
+        print("{0:<10}{1:>16,.0f}{2:>16,.1f}".format(name, rate, size))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+# ipop-project
+# Copyright 2016, University of Florida
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+# Measures CBT throughput and latency through the CFx message bus, i.e., submit_cbt, the
+# recipient's CBT queue and process_cbt, using synthetic modules in place of Tincan and XMPP.
+# Scenarios:
+#   echo         - a driver keeps a window of requests in flight to N echo modules
+#   linked       - each request is fanned out as linked CBTs to N echo modules and completed
+#                  when the last child responds
+#   subscription - a publisher posts notifications to N subscribed sink modules
+# Run from the repository root, results are written to stdout as JSON:
+#   python -m benchmarks.bench_cfx [--modules 1 4] [--count 20000] [--engine Threads]
+import argparse
+import contextlib
+import json
+import sys
+import threading
+import time
+from controller.framework.CFx import CFX
+from controller.framework.CFxHandle import CFxHandle
+from controller.framework.ControllerModule import ControllerModule
+from controller.framework.ControllerModule import request_handler, response_handler
+
+SCENARIOS = ("echo", "linked", "subscription")
+
+
+class BenchRun():
+    """State shared by the modules of one benchmark run"""
+    def __init__(self, count, window, fanout):
+        self.count = count
+        self.window = window
+        self.fanout = fanout
+        self.submitted = 0
+        self.completed = 0
+        self.delivered = 0
+        self.latencies = []
+        self.lck = threading.Lock()
+        self.done = threading.Event()
+        self.time_start = None
+        self.time_end = None
+
+    def finish(self):
+        self.time_end = time.time()
+        self.done.set()
+
+
+class BenchModule(ControllerModule):
+    def __init__(self, cfx_handle, module_config, module_name):
+        super(BenchModule, self).__init__(cfx_handle, module_config, module_name)
+        self._run = module_config["BenchRun"]
+        self._peers = module_config.get("BenchPeers", [])
+
+    def initialize(self):
+        pass
+
+    def timer_method(self):
+        pass
+
+    def terminate(self):
+        pass
+
+
+class BenchEcho(BenchModule):
+    @request_handler("BENCH_ECHO")
+    def req_handler_echo(self, cbt):
+        cbt.set_response(cbt.request.params, True)
+        self.complete_cbt(cbt)
+
+
+class BenchFanout(BenchModule):
+    @request_handler("BENCH_FANOUT")
+    def req_handler_fanout(self, cbt):
+        for peer in self._peers:
+            lcbt = self.create_linked_cbt(cbt)
+            lcbt.set_request(self._module_name, peer, "BENCH_ECHO", cbt.request.params)
+            self.submit_cbt(lcbt)
+
+    @response_handler("BENCH_ECHO")
+    def resp_handler_echo(self, cbt):
+        parent_cbt = cbt.parent
+        self.free_cbt(cbt)
+        if parent_cbt.child_count == 0:
+            parent_cbt.set_response(None, True)
+            self.complete_cbt(parent_cbt)
+
+
+class BenchDriver(BenchModule):
+    """Keeps the run's window of requests in flight and records their round trip latency"""
+    def __init__(self, cfx_handle, module_config, module_name):
+        super(BenchDriver, self).__init__(cfx_handle, module_config, module_name)
+        self._action = module_config["BenchAction"]
+        self._next_peer = 0
+
+    def _send(self):
+        run = self._run
+        if run.submitted >= run.count:
+            return
+        run.submitted += 1
+        peer = self._peers[self._next_peer]
+        self._next_peer = (self._next_peer + 1) % len(self._peers)
+        self.register_cbt(peer, self._action, run.submitted)
+
+    @request_handler("BENCH_START")
+    def req_handler_start(self, cbt):
+        self._run.time_start = time.time()
+        for _ in range(self._run.window):
+            self._send()
+        cbt.set_response(None, True)
+        self.complete_cbt(cbt)
+
+    @response_handler("BENCH_ECHO", "BENCH_FANOUT")
+    def resp_handler_echo(self, cbt):
+        run = self._run
+        # round trip, including the response's wait in this module's queue
+        run.latencies.append(time.time() - cbt.time_create)
+        self.free_cbt(cbt)
+        run.completed += 1
+        if run.completed == run.count:
+            run.finish()
+        else:
+            self._send()
+
+
+class BenchPublisher(BenchModule):
+    """Posts the run's notifications a window at a time, each window once fully delivered"""
+    def initialize(self):
+        self._publisher = self._cfx_handle.publish_subscription("BENCH_NOTIFY",
+                                                                no_response=True)
+
+    def _post_window(self):
+        run = self._run
+        for _ in range(min(run.window, run.count - run.submitted)):
+            run.submitted += 1
+            self._publisher.post_update(time.time())
+
+    @request_handler("BENCH_START")
+    def req_handler_start(self, cbt):
+        self._run.time_start = time.time()
+        self._post_window()
+        cbt.set_response(None, True)
+        self.complete_cbt(cbt)
+
+    @request_handler("BENCH_NEXT")
+    def req_handler_next(self, cbt):
+        self._post_window()
+        cbt.set_response(None, True)
+        self.complete_cbt(cbt)
+
+
+class BenchSink(BenchModule):
+    def initialize(self):
+        self._cfx_handle.start_subscription("BenchPublisher", "BENCH_NOTIFY")
+
+    @request_handler("BENCH_NOTIFY")
+    def req_handler_notify(self, cbt):
+        run = self._run
+        latency = time.time() - cbt.request.params
+        cbt.set_response(None, True)
+        self.complete_cbt(cbt)
+        with run.lck:
+            run.latencies.append(latency)
+            run.delivered += 1
+            delivered = run.delivered
+        if delivered == run.count * run.fanout:
+            run.finish()
+        elif delivered % (run.window * run.fanout) == 0:
+            # the last sink to receive a window asks for the next one
+            self.register_cbt("BenchPublisher", "BENCH_NEXT", _no_response=True)
+
+
+class BenchCFX(CFX):
+    """CFx booted from an in memory configuration of benchmark modules"""
+    def __init__(self, config, modules):
+        self._bench_config = config
+        self._bench_modules = modules
+        super(BenchCFX, self).__init__()
+
+    def parse_config(self):
+        self._config = self._bench_config
+
+    def terminate(self):
+        # CFx reports the modules exiting on stdout, which carries the benchmark results
+        with contextlib.redirect_stdout(sys.stderr):
+            super(BenchCFX, self).terminate()
+
+    def load_module(self, module_name):
+        handle = CFxHandle(self)
+        self._config[module_name]["NodeId"] = self._node_id
+        instance = self._bench_modules[module_name](handle, self._config[module_name],
+                                                    module_name)
+        handle._cm_instance = instance
+        handle._cm_config = self._config[module_name]
+        self._cfx_handle_dict[module_name] = handle
+
+
+def module_class(module_name, base):
+    # CFx addresses a module's own CBTs by its class name, so each instance gets a class
+    return type(module_name, (base,), {})
+
+
+def build_config(scenario, engine, num_modules, run):
+    config = {"CFx": {"Model": "Bench", "NodeId": "0" * 32, "Engine": engine,
+                      "RequestTimeout": 60}}
+    modules = {}
+    peers = ["BenchEcho{0}".format(i) for i in range(num_modules)]
+    if scenario in ("echo", "linked"):
+        for peer in peers:
+            config[peer] = {"BenchRun": run}
+            modules[peer] = module_class(peer, BenchEcho)
+        driver = {"BenchRun": run, "Dependencies": list(peers)}
+        if scenario == "echo":
+            driver.update(BenchPeers=peers, BenchAction="BENCH_ECHO")
+        else:
+            config["BenchFanout"] = {"BenchRun": run, "BenchPeers": peers,
+                                     "Dependencies": list(peers)}
+            modules["BenchFanout"] = BenchFanout
+            driver.update(BenchPeers=["BenchFanout"], BenchAction="BENCH_FANOUT",
+                          Dependencies=["BenchFanout"])
+        config["BenchDriver"] = driver
+        modules["BenchDriver"] = BenchDriver
+        return config, modules, "BenchDriver"
+    config["BenchPublisher"] = {"BenchRun": run}
+    modules["BenchPublisher"] = BenchPublisher
+    for i in range(num_modules):
+        name = "BenchSink{0}".format(i)
+        config[name] = {"BenchRun": run, "Dependencies": ["BenchPublisher"]}
+        modules[name] = module_class(name, BenchSink)
+    return config, modules, "BenchPublisher"
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(pct / 100.0 * len(values)))]
+
+
+def run_scenario(scenario, engine, num_modules, count, window):
+    fanout = num_modules if scenario == "subscription" else 1
+    run = BenchRun(count, window, fanout)
+    config, modules, starter = build_config(scenario, engine, num_modules, run)
+    cfx = BenchCFX(config, modules)
+    cfx.initialize()
+    try:
+        handle = cfx._cfx_handle_dict[starter]
+        handle.submit_cbt(handle.create_cbt(starter, starter, "BENCH_START", no_response=True))
+        if not run.done.wait(600):
+            raise RuntimeError("{0} benchmark did not complete".format(scenario))
+    finally:
+        cfx.terminate()
+    elapsed = run.time_end - run.time_start
+    # CBTs dispatched per operation, a request and its response count separately
+    hops = {"echo": 2, "linked": 2 + 2 * num_modules, "subscription": num_modules}[scenario]
+    latencies = sorted(run.latencies)
+    return {"Scenario": scenario,
+            "Engine": engine,
+            "Modules": num_modules,
+            "Count": count,
+            "Window": window,
+            "Seconds": elapsed,
+            "OpsPerSec": count / elapsed,
+            "CBTsPerSec": count * hops / elapsed,
+            "LatencyP50": percentile(latencies, 50),
+            "LatencyP99": percentile(latencies, 99),
+            "LatencyMax": latencies[-1] if latencies else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the CFx message bus")
+    parser.add_argument("--scenario", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--engine", nargs="+", choices=("Threads", "asyncio"),
+                        default=["Threads", "asyncio"])
+    parser.add_argument("--modules", nargs="+", type=int, default=[1, 4])
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--window", type=int, default=64)
+    parser.add_argument("--output", help="write the JSON results to a file instead of stdout")
+    args = parser.parse_args()
+
+    results = []
+    print("{0:<14}{1:<10}{2:>8}{3:>14}{4:>14}{5:>12}{6:>12}".format(
+        "Scenario", "Engine", "Modules", "Ops/sec", "CBTs/sec", "P50 (ms)", "P99 (ms)"),
+          file=sys.stderr)
+    for scenario in args.scenario:
+        for engine in args.engine:
+            for num_modules in args.modules:
+                res = run_scenario(scenario, engine, num_modules, args.count, args.window)
+                results.append(res)
+                print("{0:<14}{1:<10}{2:>8}{3:>14,.0f}{4:>14,.0f}{5:>12.3f}{6:>12.3f}".format(
+                    scenario, engine, num_modules, res["OpsPerSec"], res["CBTsPerSec"],
+                    res["LatencyP50"] * 1000, res["LatencyP99"] * 1000), file=sys.stderr)
+    report = {"Python": sys.version.split()[0], "Time": time.time(), "Results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+if __name__ == "__main__":
+    main()
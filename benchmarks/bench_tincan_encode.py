@@ -0,0 +1,154 @@
+# ipop-project
+# Copyright 2016, University of Florida
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+# Compares the per message cost of encoding each TCI_* request for Tincan with the tincanlib
+# encoders, under every available serializer, against a replica of the previous shared
+# template approach. Run from the repository root:
+#   python -m benchmarks.bench_tincan_encode [--count 50000]
+import argparse
+import json
+import time
+from controller.framework import tincanlib
+
+PARAMS = {
+    "TCI_CREATE_CTRL_LINK": {"AddressFamily": "af_inet", "IP": "127.0.0.1", "Port": 5801},
+    "TCI_CONFIGURE_LOGGING": {"LogLevel": "INFO", "Device": "File", "Directory": "./logs/",
+                              "TincanLogFileName": "tincan_log", "MaxArchives": 5,
+                              "MaxFileSize": 10000000, "ConsoleLevel": "NONE"},
+    "TCI_CREATE_LINK": {"OverlayId": "A0FB389", "TunnelId": "f" * 32, "NodeId": "a" * 32,
+                        "LinkId": "f" * 32, "Type": "TUNNEL", "TapName": "tnl-fffffff",
+                        "StunServers": ["stun.l.google.com:19302"], "TurnServers": [],
+                        "IgnoredNetInterfaces": ["ipopbr0", "docker0"],
+                        "NodeData": {"UID": "b" * 32, "MAC": "02a1b2c3d4e5",
+                                     "FPR": "sha-1 " + "AB:" * 19 + "CD",
+                                     "CAS": "1:1:udp:2122260223:10.0.0.2:40123:host " * 4}},
+    "TCI_CREATE_TUNNEL": {"OverlayId": "A0FB389", "TunnelId": "f" * 32, "NodeId": "a" * 32,
+                          "Type": "TUNNEL", "TapName": "tnl-fffffff",
+                          "StunServers": ["stun.l.google.com:19302"], "TurnServers": [],
+                          "IgnoredNetInterfaces": ["ipopbr0", "docker0"]},
+    "TCI_QUERY_CAS": {"OverlayId": "A0FB389", "LinkId": "f" * 32},
+    "TCI_QUERY_LINK_STATS": ["f" * 32, "e" * 32, "d" * 32],
+    "TCI_QUERY_TUNNEL_INFO": {"OverlayId": "A0FB389"},
+    "TCI_REMOVE_TUNNEL": {"OverlayId": "A0FB389", "TunnelId": "f" * 32},
+    "TCI_REMOVE_LINK": {"OverlayId": "A0FB389", "TunnelId": "f" * 32, "LinkId": "f" * 32},
+}
+
+
+def _template(command, **request):
+    request["Command"] = command
+    return {"IPOP": {"ProtocolVersion": 5, "TransactionId": 0,
+                     "ControlType": "TincanRequest", "Request": request}}
+
+# the shared module level templates the previous implementation mutated for every request
+TEMPLATES = {
+    "TCI_CREATE_CTRL_LINK": _template("CreateCtrlRespLink", AddressFamily="af_inetv6",
+                                      Protocol="proto_datagram", IP="::1", Port=5801),
+    "TCI_CONFIGURE_LOGGING": _template("ConfigureLogging", Level="DEBUG", Device="All",
+                                       Directory="./logs/", Filename="tincan_log",
+                                       MaxArchives=10, MaxFileSize=1048576,
+                                       ConsoleLevel="DEBUG"),
+    "TCI_CREATE_LINK": _template("CreateLink", OverlayId="", TunnelId="", LinkId="",
+                                 PeerInfo={"UID": "", "MAC": "", "FPR": ""}),
+    "TCI_CREATE_TUNNEL": _template("CreateTunnel", OverlayId="", NodeId="", TunnelId="",
+                                   TapName="", StunServers=[], TurnServers=[], Type=""),
+    "TCI_QUERY_CAS": _template("QueryCandidateAddressSet", OverlayId="", LinkId=""),
+    "TCI_QUERY_LINK_STATS": _template("QueryLinkStats", TunnelIds=[]),
+    "TCI_QUERY_TUNNEL_INFO": _template("QueryOverlayInfo", OverlayId="", TunnelId=""),
+    "TCI_REMOVE_TUNNEL": _template("RemoveTunnel", OverlayId="", TunnelId=""),
+    "TCI_REMOVE_LINK": _template("RemoveLink", OverlayId="", LinkId=""),
+}
+
+
+def legacy_encode(action, tag, msg):
+    ctl = TEMPLATES[action]
+    ctl["IPOP"]["TransactionId"] = tag
+    req = ctl["IPOP"]["Request"]
+    if action == "TCI_CREATE_CTRL_LINK":
+        req["Port"] = msg["Port"]
+        req["AddressFamily"] = msg["AddressFamily"]
+        req["IP"] = msg["IP"]
+    elif action == "TCI_CONFIGURE_LOGGING":
+        req["Level"] = msg["LogLevel"]
+        req["Device"] = msg["Device"]
+        req["Directory"] = msg["Directory"]
+        req["Filename"] = msg["TincanLogFileName"]
+        req["MaxArchives"] = msg["MaxArchives"]
+        req["MaxFileSize"] = msg["MaxFileSize"]
+        req["ConsoleLevel"] = msg["ConsoleLevel"]
+    elif action == "TCI_CREATE_LINK":
+        req["OverlayId"] = msg["OverlayId"]
+        req["TunnelId"] = msg["TunnelId"]
+        req["NodeId"] = msg.get("NodeId")
+        req["LinkId"] = msg["LinkId"]
+        req["PeerInfo"]["UID"] = msg["NodeData"].get("UID")
+        req["PeerInfo"]["MAC"] = msg["NodeData"].get("MAC")
+        req["PeerInfo"]["CAS"] = msg["NodeData"].get("CAS")
+        req["PeerInfo"]["FPR"] = msg["NodeData"].get("FPR")
+        req["StunServers"] = msg.get("StunServers")
+        req["TurnServers"] = msg.get("TurnServers")
+        req["Type"] = msg["Type"]
+        req["TapName"] = msg.get("TapName")
+        req["IgnoredNetInterfaces"] = msg.get("IgnoredNetInterfaces")
+    elif action == "TCI_CREATE_TUNNEL":
+        req["StunServers"] = msg["StunServers"]
+        req["TurnServers"] = msg.get("TurnServers")
+        req["Type"] = msg["Type"]
+        req["TapName"] = msg["TapName"]
+        req["OverlayId"] = msg["OverlayId"]
+        req["TunnelId"] = msg["TunnelId"]
+        req["NodeId"] = msg.get("NodeId")
+        req["IgnoredNetInterfaces"] = msg.get("IgnoredNetInterfaces")
+    elif action == "TCI_QUERY_LINK_STATS":
+        req["TunnelIds"] = msg
+    else:
+        for key in msg:
+            req[key] = msg[key]
+    return bytes(json.dumps(ctl).encode("utf-8"))
+
+
+def encode_rate(encode, action, count):
+    params = PARAMS[action]
+    start = time.perf_counter()
+    for tag in range(count):
+        encode(action, tag, params)
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the Tincan control message encoders")
+    parser.add_argument("--count", type=int, default=50000)
+    count = parser.parse_args().count
+    encoders = [("legacy", legacy_encode)]
+    for name in sorted(tincanlib.SERIALIZERS):
+        dumps = tincanlib.SERIALIZERS[name][0]
+        encoders.append((name, lambda action, tag, params, dumps=dumps:
+                         dumps(tincanlib.ENCODERS[action](tag, params))))
+    print("Encodes/sec, tincanlib default serializer: {0}".format(tincanlib.SERIALIZER))
+    print("{0:<24}".format("Action") + "".join("{0:>14}".format(name)
+                                               for name, _ in encoders))
+    for action in sorted(PARAMS):
+        print("{0:<24}".format(action) + "".join(
+            "{0:>14,.0f}".format(encode_rate(encode, action, count)) for _, encode in encoders))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+# ipop-project
+# Copyright 2016, University of Florida
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+# Checks that every TCI_* control message survives a round trip in each available framing, both
+# through tincanlib alone and through TincanInterface against the local Tincan stand-in, after
+# the framing is negotiated on the control link. It then compares the wire size and the encode
+# and decode cost of the framings, including a QueryLinkStats response for many tunnels. Run
+# from the repository root:
+#   python -m benchmarks.bench_tincan_framing [--count 20000] [--tunnels 1 16 128]
+import argparse
+import socket
+import sys
+import time
+from controller.framework import tincanlib
+from controller.modules.Logger import Logger
+from controller.modules.TincanInterface import TincanInterface
+from controller.framework.ControllerModule import request_handler, response_handler
+from benchmarks.bench_cfx import BenchCFX, BenchModule, BenchRun
+from benchmarks.bench_tincan_encode import PARAMS
+from benchmarks.tincan_stub import TincanStub
+
+# the requests a module can submit to TincanInterface, the others are TincanInterface's own
+LINK_ACTIONS = sorted(action for action in PARAMS
+                      if action not in ("TCI_CREATE_CTRL_LINK", "TCI_CONFIGURE_LOGGING"))
+
+
+def expected(action, tag, params, framing):
+    msg = tincanlib.ENCODERS[action](tag, params)
+    if framing != tincanlib.FRAMING_JSON:
+        msg["IPOP"]["ProtocolVersion"] = tincanlib.BINARY_PROTOCOL_VERSION
+    return msg
+
+
+def codec_round_trip():
+    for framing in tincanlib.FRAMINGS:
+        batch = []
+        for tag, action in enumerate(sorted(PARAMS)):
+            data = tincanlib.encode(action, tag, PARAMS[action], framing)
+            if tincanlib.decode(data) != expected(action, tag, PARAMS[action], framing):
+                raise AssertionError("{0} {1} round trip mismatch".format(framing, action))
+            batch.append(data)
+        msgs = tincanlib.decode(tincanlib.join(batch))
+        if msgs != [expected(action, tag, PARAMS[action], framing)
+                    for tag, action in enumerate(sorted(PARAMS))]:
+            raise AssertionError("{0} batch round trip mismatch".format(framing))
+        print("codec round trip ok: {0}".format(framing), file=sys.stderr)
+
+
+class FramingDriver(BenchModule):
+    """Sends every TCI_* request through TincanInterface and checks what the stub received"""
+    @request_handler("BENCH_START")
+    def req_handler_start(self, cbt):
+        self._run.time_start = time.time()
+        for _ in range(self._run.count):
+            for action in LINK_ACTIONS:
+                self._run.submitted += 1
+                self.register_cbt("TincanInterface", action, PARAMS[action])
+        cbt.set_response(None, True)
+        self.complete_cbt(cbt)
+
+    @response_handler(*LINK_ACTIONS)
+    def resp_handler_tincan(self, cbt):
+        run = self._run
+        req = tincanlib.ENCODERS[cbt.request.action](cbt.tag, cbt.request.params)
+        # the stub echoes the request it decoded as the response message
+        if not cbt.response.status or cbt.response.data != req["IPOP"]["Request"]:
+            run.latencies.append(cbt.request.action)
+        self.free_cbt(cbt)
+        run.completed += 1
+        if run.completed == run.submitted:
+            run.finish()
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def link_round_trip(framing, count, batch_window=0):
+    stub = TincanStub(("127.0.0.1", 0), framings=tincanlib.FRAMINGS)
+    stub.start()
+    run = BenchRun(count, 1, 1)
+    config = {
+        "CFx": {"Model": "Bench", "NodeId": "0" * 32, "RequestTimeout": 30},
+        "Logger": {"LogLevel": "ERROR", "Device": "Console", "Directory": "./logs/",
+                   "CtrlLogFileName": "ctrl.log", "TincanLogFileName": "tincan_log",
+                   "MaxFileSize": 1000000, "MaxArchives": 5, "ConsoleLevel": None},
+        "TincanInterface": {"MaxReadSize": 65507, "SocketReadWaitTime": 1,
+                            "RcvServiceAddress": "127.0.0.1", "SndServiceAddress": "127.0.0.1",
+                            "CtrlRecvPort": free_port(), "CtrlSendPort": stub.address[1],
+                            "BatchWindow": batch_window, "RcvBufferSize": 1048576,
+                            "Framing": framing, "Dependencies": ["Logger"]},
+        "FramingDriver": {"BenchRun": run, "Dependencies": ["TincanInterface"]},
+    }
+    cfx = BenchCFX(config, {"Logger": Logger, "TincanInterface": TincanInterface,
+                            "FramingDriver": FramingDriver})
+    cfx.initialize()
+    try:
+        tci = cfx._cfx_handle_dict["TincanInterface"]._cm_instance
+        deadline = time.time() + 5
+        while stub.framing != framing or tci._framing != framing:
+            if time.time() > deadline:
+                raise AssertionError("{0} framing was not negotiated".format(framing))
+            time.sleep(0.01)
+        handle = cfx._cfx_handle_dict["FramingDriver"]
+        handle.submit_cbt(handle.create_cbt("FramingDriver", "FramingDriver", "BENCH_START",
+                                            no_response=True))
+        if not run.done.wait(60):
+            raise AssertionError("{0} link round trip did not complete".format(framing))
+    finally:
+        cfx.terminate()
+        stub.stop()
+    if run.latencies:
+        raise AssertionError("{0} link round trip mismatches: {1}".format(
+            framing, sorted(set(run.latencies))))
+    print("link round trip ok: {0}, batch window {1}, {2} requests in {3:.3f}s".format(
+        framing, batch_window, run.completed, run.time_end - run.time_start), file=sys.stderr)
+
+
+def link_stats_response(tag, num_tunnels):
+    stats = [{"best_conn": i == 0, "writable": True, "timeout": False, "new_conn": False,
+              "rtt": 12 + i, "sent_total_bytes": 1048576 * (i + 1),
+              "sent_bytes_second": 2048, "recv_total_bytes": 2097152 * (i + 1),
+              "recv_bytes_second": 4096, "local_candidate": "10.0.{0}.2:40123".format(i),
+              "remote_candidate": "10.1.{0}.2:51234".format(i)} for i in range(4)]
+    message = {"{0:032x}".format(tnl): {"{0:032x}".format(~tnl & 0xffff): {
+        "Status": "ONLINE", "Stats": stats}} for tnl in range(num_tunnels)}
+    return {"IPOP": {"ProtocolVersion": tincanlib.PROTOCOL_VERSION, "TransactionId": tag,
+                     "ControlType": "TincanResponse",
+                     "Request": {"Command": "QueryLinkStats",
+                                 "TunnelIds": sorted(message)},
+                     "Response": {"Success": True, "Message": message}}}
+
+
+def measure(msg, framing, count):
+    if framing == tincanlib.FRAMING_JSON:
+        encode = tincanlib.dumps
+    else:
+        encode = tincanlib.frame
+    start = time.perf_counter()
+    for _ in range(count):
+        data = encode(msg)
+    encode_us = (time.perf_counter() - start) / count * 1e6
+    start = time.perf_counter()
+    for _ in range(count):
+        tincanlib.decode(data)
+    decode_us = (time.perf_counter() - start) / count * 1e6
+    return len(data), encode_us, decode_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the Tincan control framings")
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--tunnels", nargs="+", type=int, default=[1, 16, 128])
+    parser.add_argument("--requests", type=int, default=200,
+                        help="rounds of TCI_* requests sent through TincanInterface")
+    args = parser.parse_args()
+    if tincanlib.FRAMING_MSGPACK not in tincanlib.FRAMINGS:
+        print("msgpack is not installed, only the JSON framing is available", file=sys.stderr)
+
+    codec_round_trip()
+    for framing in tincanlib.FRAMINGS:
+        for batch_window in (0, 0.005):
+            link_round_trip(framing, args.requests, batch_window)
+
+    msgs = [(action, tincanlib.ENCODERS[action](0, PARAMS[action])) for action in sorted(PARAMS)]
+    msgs.extend(("LinkStats x{0}".format(num), link_stats_response(0, num))
+                for num in args.tunnels)
+    print("Bytes / encode us / decode us, JSON serializer: {0}".format(tincanlib.SERIALIZER))
+    print("{0:<24}".format("Message") + "".join(
+        "{0:>30}".format(framing) for framing in tincanlib.FRAMINGS))
+    for name, msg in msgs:
+        count = max(args.count // max(len(tincanlib.dumps(msg)) // 256, 1), 100)
+        print("{0:<24}".format(name) + "".join(
+            "{0:>12,}{1:>9.2f}{2:>9.2f}".format(*measure(msg, framing, count))
+            for framing in tincanlib.FRAMINGS))
+
+if __name__ == "__main__":
+    main()
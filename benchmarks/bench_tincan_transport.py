@@ -0,0 +1,167 @@
+# ipop-project
+# Copyright 2016, University of Florida
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+# Compares the controller to Tincan control channel transports, UDP on the loopback and the unix
+# domain socket transport as datagrams or a seqpacket connection, through TincanInterface and
+# the local Tincan stand-in. It measures the round trip latency of single requests and checks
+# that a QueryLinkStats response for many tunnels arrives whole. Run from the repository root:
+#   python -m benchmarks.bench_tincan_transport [--count 5000] [--tunnels 16 128]
+import argparse
+import os
+import socket
+import tempfile
+import time
+from controller.framework import tincanlib
+from controller.modules.Logger import Logger
+from controller.modules.TincanInterface import TincanInterface
+from controller.framework.ControllerModule import request_handler, response_handler
+from benchmarks.bench_cfx import BenchCFX, BenchModule, BenchRun, percentile
+from benchmarks.bench_tincan_framing import free_port, link_stats_response
+from benchmarks.tincan_stub import TincanStub
+
+TRANSPORTS = ("udp", "unix-dgram", "unix-seqpacket")
+# the largest UDP payload, a bigger response cannot be carried by the udp transport
+MAX_UDP_PAYLOAD = 65507
+
+
+class TransportDriver(BenchModule):
+    """Sends one request to TincanInterface at a time and records its round trip latency"""
+    def __init__(self, cfx_handle, module_config, module_name):
+        super(TransportDriver, self).__init__(cfx_handle, module_config, module_name)
+        self._action = module_config["BenchAction"]
+        self._params = module_config["BenchParams"]
+        self._check = module_config["BenchCheck"]
+        self.failures = 0
+
+    def _send(self):
+        self._run.submitted += 1
+        self.register_cbt("TincanInterface", self._action, self._params)
+
+    @request_handler("BENCH_START")
+    def req_handler_start(self, cbt):
+        self._run.time_start = time.time()
+        self._send()
+        cbt.set_response(None, True)
+        self.complete_cbt(cbt)
+
+    @response_handler("TCI_QUERY_TUNNEL_INFO", "TCI_QUERY_LINK_STATS")
+    def resp_handler_tincan(self, cbt):
+        run = self._run
+        run.latencies.append(time.time() - cbt.time_create)
+        if not cbt.response.status or not self._check(cbt.response.data):
+            self.failures += 1
+        self.free_cbt(cbt)
+        run.completed += 1
+        if run.completed == run.count:
+            run.finish()
+        else:
+            self._send()
+
+
+def run_transport(transport, engine, action, params, count, responders=None, check=bool):
+    tmpdir = tempfile.mkdtemp(prefix="ipop-bench-")
+    tci_config = {"MaxReadSize": 65507, "SocketReadWaitTime": 1,
+                  "RcvServiceAddress": "127.0.0.1", "SndServiceAddress": "127.0.0.1",
+                  "RcvBufferSize": 1048576, "UnixMaxReadSize": 4194304,
+                  "Dependencies": ["Logger"]}
+    if transport == "udp":
+        stub = TincanStub(("127.0.0.1", 0), responders)
+        tci_config.update({"CtrlRecvPort": free_port(), "CtrlSendPort": stub.address[1]})
+    else:
+        sock_type = transport.split("-")[1]
+        stub = TincanStub(os.path.join(tmpdir, "tincan.sock"), responders,
+                          sock_type={"dgram": socket.SOCK_DGRAM,
+                                     "seqpacket": socket.SOCK_SEQPACKET}[sock_type])
+        tci_config.update({"Transport": "unix", "SocketType": sock_type,
+                           "CtrlRecvPath": os.path.join(tmpdir, "ctrl.sock"),
+                           "CtrlSendPath": stub.address})
+    stub.start()
+    run = BenchRun(count, 1, 1)
+    config = {
+        "CFx": {"Model": "Bench", "NodeId": "0" * 32, "Engine": engine, "RequestTimeout": 30},
+        "Logger": {"LogLevel": "ERROR", "Device": "Console", "Directory": "./logs/",
+                   "CtrlLogFileName": "ctrl.log", "TincanLogFileName": "tincan_log",
+                   "MaxFileSize": 1000000, "MaxArchives": 5, "ConsoleLevel": None},
+        "TincanInterface": tci_config,
+        "TransportDriver": {"BenchRun": run, "BenchAction": action, "BenchParams": params,
+                            "BenchCheck": check, "Dependencies": ["TincanInterface"]},
+    }
+    cfx = BenchCFX(config, {"Logger": Logger, "TincanInterface": TincanInterface,
+                            "TransportDriver": TransportDriver})
+    cfx.initialize()
+    try:
+        # let the control link come up before timing requests
+        time.sleep(0.2)
+        handle = cfx._cfx_handle_dict["TransportDriver"]
+        handle.submit_cbt(handle.create_cbt("TransportDriver", "TransportDriver", "BENCH_START",
+                                            no_response=True))
+        completed = run.done.wait(60)
+        failures = handle._cm_instance.failures
+    finally:
+        cfx.terminate()
+        stub.stop()
+        os.rmdir(tmpdir)
+    if not completed:
+        raise RuntimeError("{0} {1} {2} did not complete".format(transport, engine, action))
+    return run, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the Tincan control transports")
+    parser.add_argument("--engine", nargs="+", choices=("Threads", "asyncio"),
+                        default=["Threads", "asyncio"])
+    parser.add_argument("--count", type=int, default=5000)
+    parser.add_argument("--tunnels", nargs="+", type=int, default=[16, 128])
+    args = parser.parse_args()
+
+    print("{0:<16}{1:<10}{2:>14}{3:>12}{4:>12}".format(
+        "Transport", "Engine", "Requests/sec", "P50 (us)", "P99 (us)"))
+    for transport in TRANSPORTS:
+        for engine in args.engine:
+            run, _ = run_transport(transport, engine, "TCI_QUERY_TUNNEL_INFO",
+                                   {"OverlayId": "A0FB389"}, args.count)
+            latencies = sorted(run.latencies)
+            print("{0:<16}{1:<10}{2:>14,.0f}{3:>12.1f}{4:>12.1f}".format(
+                transport, engine, run.count / (run.time_end - run.time_start),
+                percentile(latencies, 50) * 1e6, percentile(latencies, 99) * 1e6))
+
+    print()
+    print("{0:<16}{1:<10}{2:>10}{3:>12}{4:>12}".format(
+        "Transport", "Engine", "Tunnels", "Bytes", "Result"))
+    for num_tunnels in args.tunnels:
+        stats = link_stats_response(0, num_tunnels)["IPOP"]["Response"]["Message"]
+        size = len(tincanlib.dumps(link_stats_response(0, num_tunnels)))
+        responders = {"QueryLinkStats": lambda req, stats=stats: (True, stats)}
+        for transport in TRANSPORTS:
+            for engine in args.engine:
+                if transport == "udp" and size > MAX_UDP_PAYLOAD:
+                    result = "too large"
+                else:
+                    _, failures = run_transport(
+                        transport, engine, "TCI_QUERY_LINK_STATS", sorted(stats), 10,
+                        responders, lambda data, stats=stats: data == stats)
+                    result = "ok" if failures == 0 else "{0} failed".format(failures)
+                print("{0:<16}{1:<10}{2:>10}{3:>12,}{4:>12}".format(
+                    transport, engine, num_tunnels, size, result))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+# ipop-project
+# Copyright 2016, University of Florida
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+# A local stand-in for Tincan's control channel, for exercising TincanInterface without the
+# Tincan process. It answers every control request with a successful TincanResponse, once the
+# controller has created its control link, and mirrors batching by answering a datagram that
+# carries an array of requests with an array of responses. A controller that asks for the
+# msgpack framing when creating its control link is answered in it, when the stub accepts it.
+# Given a path instead of an address it serves the unix transport, as datagrams or over a
+# seqpacket connection. Run from the repository root:
+#   python -m benchmarks.tincan_stub [--port 5800] [--framing msgpack]
+#   python -m benchmarks.tincan_stub --path /tmp/ipop-tincan.sock [--seqpacket]
+import argparse
+import json
+import os
+import random
+import socket
+import threading
+import time
+import controller.framework.tincanlib as tincanlib
+
+
+class TincanStub():
+    def __init__(self, address=("127.0.0.1", 5800), responders=None, framings=("json",),
+                 sock_type=socket.SOCK_DGRAM, loss=0.0):
+        """
+        responders optionally maps a request's Command to a function that is passed the
+        request and returns the (Success, Message) for the response, the default echoes the
+        request back as the Message. framings are the control framings the stub accepts. An
+        address that is a path selects the unix transport, of sock_type. loss is the
+        fraction of requests silently dropped, to exercise the controller's retransmissions.
+        """
+        self._unix = isinstance(address, str)
+        self._sock_type = sock_type
+        self._sock = socket.socket(socket.AF_UNIX if self._unix else socket.AF_INET, sock_type)
+        # absorb the bursts of an unbatched controller, the kernel caps it at rmem_max
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        if self._unix:
+            # large responses such as link stats are sent whole on the unix transport
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4 * 1024 * 1024)
+            try:
+                os.unlink(address)
+            except FileNotFoundError:
+                pass
+        self._sock.bind(address)
+        if sock_type == socket.SOCK_SEQPACKET:
+            self._sock.listen(1)
+        self._conn = None
+        self._loss = loss
+        self._responders = responders or {}
+        self._framings = framings
+        self.framing = tincanlib.FRAMING_JSON
+        self._ctrl_addr = None
+        self._thread = None
+        self._running = False
+        self.datagrams_received = 0
+        self.messages_received = 0
+        self.datagrams_sent = 0
+        self.messages_dropped = 0
+
+    @property
+    def address(self):
+        return self._sock.getsockname()
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, name="TincanStub", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._sock_type == socket.SOCK_SEQPACKET:
+            # shutting down wakes a blocked accept or recv
+            for sock in (self._sock, self._conn):
+                if sock is not None:
+                    try:
+                        sock.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+        else:
+            # closing the socket does not wake a blocked recvfrom, an empty datagram does
+            with socket.socket(self._sock.family, socket.SOCK_DGRAM) as sock:
+                sock.sendto(b"", self.address)
+        self._thread.join()
+        if self._conn is not None:
+            self._conn.close()
+        address = self.address
+        self._sock.close()
+        if self._unix:
+            os.unlink(address)
+
+    def _serve(self):
+        sock = self._sock
+        if self._sock_type == socket.SOCK_SEQPACKET:
+            try:
+                self._conn, _ = self._sock.accept()
+            except OSError:
+                return
+            sock = self._conn
+        while self._running:
+            try:
+                data = sock.recv(1048576)
+            except OSError:
+                break
+            if not self._running or not data:
+                break
+            self.datagrams_received += 1
+            ctl = tincanlib.decode(data)
+            if isinstance(ctl, list):
+                resps = [self._respond(msg) for msg in ctl]
+                self._send([resp for resp in resps if resp is not None])
+            else:
+                resp = self._respond(ctl)
+                if resp is not None:
+                    self._send(resp)
+
+    def _respond(self, ctl):
+        self.messages_received += 1
+        req = ctl["IPOP"]["Request"]
+        if self._loss and req["Command"] != "CreateCtrlRespLink" and \
+            random.random() < self._loss:
+            self.messages_dropped += 1
+            return None
+        if req["Command"] == "CreateCtrlRespLink":
+            if req["AddressFamily"] == "af_unix":
+                # responses go back on the seqpacket connection when there is no path
+                self._ctrl_addr = req.get("Path", "")
+            else:
+                self._ctrl_addr = (req["IP"], req["Port"])
+            framing = req.get("Framing", tincanlib.FRAMING_JSON)
+            self.framing = framing if framing in self._framings else tincanlib.FRAMING_JSON
+        responder = self._responders.get(req["Command"])
+        success, message = responder(req) if responder else (True, req)
+        return {"IPOP": {"ProtocolVersion": self._protocol_version(),
+                         "TransactionId": ctl["IPOP"]["TransactionId"],
+                         "ControlType": "TincanResponse", "Request": req,
+                         "Response": {"Success": success, "Message": message}}}
+
+    def _protocol_version(self):
+        if self.framing == tincanlib.FRAMING_JSON:
+            return tincanlib.PROTOCOL_VERSION
+        return tincanlib.BINARY_PROTOCOL_VERSION
+
+    def notify(self, request):
+        """ Send the controller an unsolicited TincanRequest, e.g., a LinkStateChange """
+        self._send({"IPOP": {"ProtocolVersion": self._protocol_version(), "TransactionId": 0,
+                             "ControlType": "TincanRequest", "Request": request}})
+
+    def _send(self, ctl):
+        if self._ctrl_addr is None or not ctl:
+            return
+        if self.framing == tincanlib.FRAMING_JSON:
+            data = json.dumps(ctl).encode("utf-8")
+        elif isinstance(ctl, list):
+            data = b"".join(tincanlib.frame(msg) for msg in ctl)
+        else:
+            data = tincanlib.frame(ctl)
+        if self._conn is not None:
+            self._conn.send(data)
+        else:
+            self._sock.sendto(data, self._ctrl_addr)
+        self.datagrams_sent += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in Tincan control channel")
+    parser.add_argument("--address", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5800)
+    parser.add_argument("--path", help="serve the unix transport at this path")
+    parser.add_argument("--seqpacket", action="store_true",
+                        help="use a seqpacket connection on the unix transport")
+    parser.add_argument("--loss", type=float, default=0.0,
+                        help="fraction of requests to drop unanswered")
+    parser.add_argument("--framing", choices=tincanlib.FRAMINGS, default="json",
+                        help="Also accept this control framing")
+    args = parser.parse_args()
+    stub = TincanStub(args.path or (args.address, args.port),
+                      framings=tuple({tincanlib.FRAMING_JSON, args.framing}),
+                      sock_type=socket.SOCK_SEQPACKET if args.seqpacket else socket.SOCK_DGRAM,
+                      loss=args.loss)
+    stub.start()
+    print("Tincan stub listening on {0}".format(stub.address))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    stub.stop()
+    print("datagrams received={0}, messages received={1}, dropped={2}, datagrams sent={3}"
+          .format(stub.datagrams_received, stub.messages_received, stub.messages_dropped,
+                  stub.datagrams_sent))
+
+if __name__ == "__main__":
+    main()
@@ -19,12 +19,40 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import threading
+import time
+import types
 import uuid
 
 
 class CBT():
+    __slots__ = ("tag", "parent", "child_count", "completed", "no_response", "op_type",
+                 "request", "response", "priority", "time_create", "time_submit",
+                 "time_complete", "time_free")
+
     tag_counter = int(uuid.uuid4().hex[:15], base=16)
+    # Priority classes, lower values are serviced first
+    PRIORITY_CONTROL = 0
+    PRIORITY_RESPONSE = 1
+    PRIORITY_TELEMETRY = 2
+    PRIORITY_LOG = 3
+    PRIORITY_CLASSES = 4
+    ACTION_PRIORITY = {
+        "LOG_DEBUG": PRIORITY_LOG,
+        "LOG_INFO": PRIORITY_LOG,
+        "LOG_WARNING": PRIORITY_LOG,
+        "LOG_ERROR": PRIORITY_LOG,
+        "VIS_DATA_REQ": PRIORITY_TELEMETRY,
+        "TCI_QUERY_LINK_STATS": PRIORITY_TELEMETRY,
+        "LNK_QUERY_TUNNEL_INFO": PRIORITY_TELEMETRY,
+        "SIG_QUERY_REPORTING_DATA": PRIORITY_TELEMETRY,
+    }
+    # action_priority results, CBT actions are a small fixed set
+    _action_priorities = {}
+
     class Request():
+        __slots__ = ("initiator", "recipient", "action", "params")
+
         def __init__(self, initiator="", recipient="", action="", params=None):
             self.initiator = initiator
             self.recipient = recipient
@@ -43,6 +71,8 @@ class CBT():
             yield("params", self.params)
 
     class Response():
+        __slots__ = ("status", "initiator", "recipient", "data")
+
         def __init__(self,):
             self.status = False
             self.initiator = None
@@ -60,44 +90,95 @@ class CBT():
             yield("recipient", self.recipient)
             yield("data", self.data)
 
-    def __init__(self, initiator="", recipient="", action="", params=""):
+    def __init__(self, initiator="", recipient="", action="", params="", priority=None):
         self.tag = CBT.tag_counter
         CBT.tag_counter = CBT.tag_counter + 1
         self.parent = None
         self.child_count = 0
         self.completed = False
+        self.no_response = False
         self.op_type = "Request"
         self.request = self.Request(initiator, recipient, action, params)
         self.response = None
+        if priority is None:
+            priority = CBT._action_priorities.get(action)
+            if priority is None:
+                priority = CBT.action_priority(action)
+        self.priority = priority
+        self.time_create = None
+        self.time_submit = None
+        self.time_complete = None
+        self.time_free = None
+
+    def reset(self, initiator="", recipient="", action="", params="", priority=None):
+        """
+        Reinitialize a recycled CBT from the handle's pool for reuse, it mirrors __init__. It is
+        given a new tag so that it cannot be mistaken for the request it previously carried.
+        """
+        self.tag = CBT.tag_counter
+        CBT.tag_counter = CBT.tag_counter + 1
+        self.parent = None
+        self.child_count = 0
+        self.completed = False
+        self.no_response = False
+        self.op_type = "Request"
+        self.request.initiator = initiator
+        self.request.recipient = recipient
+        self.request.action = action
+        self.request.params = params
+        self.response = None
+        self.priority = CBT.action_priority(action) if priority is None else priority
         self.time_create = None
         self.time_submit = None
         self.time_complete = None
         self.time_free = None
 
     def __repr__(self):
-        msg = ("CBT<tag=%d, parent=%s, child_count=%d, completed=%r, op_type=%s, request=%r,"
-               " response=%r>" % (self.tag, str(self.parent), self.child_count, self.completed,
-                                  self.op_type, self.request, self.response))
+        msg = ("CBT<tag=%d, parent=%s, child_count=%d, completed=%r, op_type=%s, priority=%d,"
+               " request=%r, response=%r>" % (self.tag, str(self.parent), self.child_count,
+                                              self.completed, self.op_type, self.priority,
+                                              self.request, self.response))
         return msg
 
+    @staticmethod
+    def action_priority(action):
+        priority = CBT._action_priorities.get(action)
+        if priority is None:
+            if action and action.startswith("LOG_") and action != "LOG_QUERY_CONFIG":
+                priority = CBT.PRIORITY_LOG
+            else:
+                priority = CBT.ACTION_PRIORITY.get(action, CBT.PRIORITY_CONTROL)
+            CBT._action_priorities[action] = priority
+        return priority
+
+    @property
+    def queue_priority(self):
+        # a response is never serviced ahead of the class of its request
+        if self.op_type == "Response":
+            return max(self.priority, CBT.PRIORITY_RESPONSE)
+        return self.priority
+
     def __itr__(self):
         yield("tag", self.tag)
         yield("parent", self.parent)
         yield("child_count", self.child_count)
         yield("completed", self.completed)
+        yield("no_response", self.no_response)
         yield("op_type", self.op_type)
         yield("request", self.request)
         yield("response", self.response)
+        yield("priority", self.priority)
         yield("time_create", self.time_create)
         yield("time_submit", self.time_submit)
         yield("time_complete", self.time_complete)
         yield("time_free", self.time_free)
 
-    def set_request(self, initiator="", recipient="", action="", params=""):
+    def set_request(self, initiator="", recipient="", action="", params="", priority=None):
         self.request.initiator = initiator
         self.request.recipient = recipient
         self.request.action = action
         self.request.params = params
+        self.priority = CBT.action_priority(action) if priority is None else priority
 
     def set_response(self, data="", status=False):
         self.op_type = "Response"
@@ -110,3 +191,49 @@ class CBT():
     def set_as_parent(self, cbt):
         self.parent = cbt
         cbt.child_count = cbt.child_ount + 1
+
+
+class Notification(CBT):
+    """
+    A subscription update delivered as one shared CBT to every sink. The params are frozen so
+    that no sink can observe another's changes, and the notification is never answered: it is
+    released, instead of freed, by each sink that completes it.
+    """
+    __slots__ = ("refcount",)
+    _lck = threading.Lock()
+
+    def __init__(self, initiator="", action="", params=None, priority=None):
+        super(Notification, self).__init__(initiator, None, action, Notification.freeze(params),
+                                           priority)
+        self.no_response = True
+        self.refcount = 0
+
+    @staticmethod
+    def freeze(obj):
+        # returns a read only copy of a message built from dicts, lists and sets
+        if isinstance(obj, dict):
+            return types.MappingProxyType({key: Notification.freeze(val)
+                                           for key, val in obj.items()})
+        if isinstance(obj, (list, tuple)):
+            return tuple(Notification.freeze(val) for val in obj)
+        if isinstance(obj, set):
+            return frozenset(obj)
+        return obj
+
+    @property
+    def completed(self):
+        # shared by the sinks, each of which services it as an outstanding request
+        return False
+
+    @completed.setter
+    def completed(self, value):
+        pass
+
+    def set_response(self, data="", status=False):
+        pass
+
+    def release(self):
+        with Notification._lck:
+            self.refcount = self.refcount - 1
+            if self.refcount == 0:
+                self.time_free = time.time()
@@ -21,6 +21,7 @@
 
 import os
 import json
+import asyncio
 import signal
 import argparse
 import threading
@@ -28,8 +29,10 @@ import time
 import importlib
 import uuid
 import controller.framework.fxlib as fxlib
+from controller.framework.CBT import Notification
 from controller.framework.CFxHandle import CFxHandle
 from controller.framework.CFxSubscription import CFxSubscription
+from controller.framework.CFxTimer import TimerWheel, LoopTimerService
 
 # pylint: disable=protected-access
 class CFX():
@@ -44,15 +47,53 @@ class CFX():
         self._cfx_handle_dict = {}
         self.model = self._config["CFx"]["Model"]
         self._event = None
+        # subscriptions indexed by (owner name, subscription name)
         self._subscriptions = {}
+        self._subscription_owners = {}
+        # sinks of the topic subscriptions, indexed by (owner name, subscription name prefix)
+        self._topic_sinks = {}
         self._node_id = self._set_node_id()
         self._load_order = []
+        self._event_loop = None
+        self._event_loop_thread = None
+        if self._config["CFx"].get("Engine", "Threads") == "asyncio":
+            # all modules are serviced by coroutines sharing a single event loop thread
+            self._event_loop = asyncio.new_event_loop()
+            self._event_loop_thread = threading.Thread(target=self.__run_event_loop,
+                                                       name="CFx::__event_loop", daemon=False)
+            self._timer_service = LoopTimerService(self._event_loop)
+        else:
+            self._timer_service = TimerWheel(self._config["CFx"].get("TimerResolution", 0.25))
 
     def submit_cbt(self, cbt):
         recipient = cbt.request.recipient
         if cbt.op_type == "Response":
             recipient = cbt.response.recipient
-        self._cfx_handle_dict[recipient]._cm_queue.put(cbt)
+        shed = self._cfx_handle_dict[recipient]._cm_queue.put(cbt)
+        if shed is not None:
+            self._fail_shed_cbt(shed, recipient)
+
+    def broadcast_cbt(self, cbt, recipients):
+        # deliver the one shared notification to the queue of every recipient
+        cbt.refcount = len(recipients)
+        cbt.time_submit = time.time()
+        for recipient in recipients:
+            shed = self._cfx_handle_dict[recipient]._cm_queue.put(cbt)
+            if shed is not None:
+                self._fail_shed_cbt(shed, recipient)
+
+    def _fail_shed_cbt(self, cbt, recipient):
+        # the request never reached its recipient, complete it as failed back to the initiator
+        if isinstance(cbt, Notification):
+            cbt.release()
+            return
+        if cbt.no_response or cbt.request.initiator not in self._cfx_handle_dict:
+            return
+        cbt.set_response("{0} CBT queue overloaded, {1} request shed"
+                         .format(recipient, cbt.request.action), False)
+        cbt.time_complete = time.time()
+        cbt.completed = True
+        self.submit_cbt(cbt)
 
     def initialize(self,):
         # check for circular dependencies in the configuration file
@@ -67,6 +108,17 @@ class CFX():
             raise RuntimeError("Circular dependency detected in config.json. Fix and restart IPOP")
 
         self.build_load_order()
+        if self._event_loop is not None:
+            for module_name in self._load_order:
+                module_config = self._config[module_name]
+                if self.module_param(module_config, "MaxQueueSize", 0) > 0 and \
+                    self.module_param(module_config, "QueueOverflowPolicy", "Block") == "Block":
+                    raise ValueError("{0}: QueueOverflowPolicy Block cannot be used with the "
+                                     "asyncio engine, the submitter would block the event "
+                                     "loop".format(module_name))
+        # the event loop must be running for the modules that use it during initialization
+        if self._event_loop_thread is not None:
+            self._event_loop_thread.start()
         # iterate and load the modules specified in the configuration file
         for module_name in self._load_order:
             self.load_module(module_name)
@@ -75,11 +127,14 @@ class CFX():
         for module_name in self._load_order:
             self._cfx_handle_dict[module_name].initialize()
 
-        # start all the worker and timer threads
+        # start all the module workers and the timer service
         for module_name in self._cfx_handle_dict:
-            self._cfx_handle_dict[module_name]._cm_thread.start()
-            if self._cfx_handle_dict[module_name]._timer_thread:
-                self._cfx_handle_dict[module_name]._timer_thread.start()
+            self._cfx_handle_dict[module_name].start()
+        self._timer_service.start()
+
+    def __run_event_loop(self):
+        asyncio.set_event_loop(self._event_loop)
+        self._event_loop.run_forever()
 
     def load_module(self, module_name):
         """
@@ -149,6 +204,14 @@ class CFX():
         # pylint: disable=unused-argument
         print("Signal handler called with signal ", signum)
 
+    def __shutdown_handler(self, signum=None, frame=None):
+        CFX.__handler(signum, frame)
+        self._event.set()
+
+    def __metrics_handler(self, signum=None, frame=None):
+        # pylint: disable=unused-argument
+        print(json.dumps(self.query_param("Metrics"), indent=2, sort_keys=True))
+
     def parse_config(self):
         self._config = fxlib.CONFIG
         self._set_nid_file_name()
@@ -225,25 +288,36 @@ class CFX():
                     break
         else:
             for sig in [signal.SIGINT, signal.SIGTERM]:
-                signal.signal(sig, CFX.__handler)
-            # sleeps until signal is received
+                signal.signal(sig, self.__shutdown_handler)
+            # SIGUSR1 dumps the CBT timing metrics without shutting down
             # pylint: disable=no-member
-            signal.pause()
+            signal.signal(signal.SIGUSR1, self.__metrics_handler)
+            # sleeps until a shutdown signal is received
+            while not self._event.is_set():
+                signal.pause()
 
     def terminate(self):
+        self._timer_service.stop()
         for module_name in self._cfx_handle_dict:
-            if self._cfx_handle_dict[module_name]._timer_thread:
-                self._cfx_handle_dict[module_name]._exit_event.set()
             self._cfx_handle_dict[module_name]._cm_queue.put(None)
 
         # wait for the threads to process their current CBTs and exit
         print("waiting for threads to exit ...")
         for module_name in self._cfx_handle_dict:
-            self._cfx_handle_dict[module_name]._cm_thread.join()
-            print("{0} exited".format(self._cfx_handle_dict[module_name]._cm_thread.name))
-            if self._cfx_handle_dict[module_name]._timer_thread:
-                self._cfx_handle_dict[module_name]._timer_thread.join()
-                print("{0} exited".format(self._cfx_handle_dict[module_name]._timer_thread.name))
+            self._cfx_handle_dict[module_name].join()
+            print("{0} exited".format(module_name))
+        if self._event_loop_thread is not None:
+            self._event_loop.call_soon_threadsafe(self._event_loop.stop)
+            self._event_loop_thread.join()
+            self._event_loop.close()
+            print("{0} exited".format(self._event_loop_thread.name))
+
+    def module_param(self, module_config, param_name, default=None):
+        # a module's own setting, falling back to the node wide one in the CFx section
+        val = module_config.get(param_name)
+        if val is None:
+            val = self._config["CFx"].get(param_name, default)
+        return val
 
     def query_param(self, param_name=""):
         val = None
@@ -260,52 +334,86 @@ class CFX():
                 val = self._config["CFx"].get("DebugCBTs", False)
             elif param_name == "RequestTimeout":
                 val = self._config["CFx"]["RequestTimeout"]
+            elif param_name == "QueueStats":
+                val = {module_name: handle._cm_queue.stats()
+                       for module_name, handle in self._cfx_handle_dict.items()}
+            elif param_name == "Metrics":
+                val = {module_name: handle._metrics.snapshot()
+                       for module_name, handle in self._cfx_handle_dict.items()}
         except KeyError as err:
             print("Exception occurred while querying paramater:{0}, key:{1}"
                   .format(param_name, str(err)))
         return val
 
     # Caller is the subscription source
-    def publish_subscription(self, owner_name, subscription_name, owner):
-        sub = CFxSubscription(owner_name, subscription_name)
+    def publish_subscription(self, owner_name, subscription_name, owner, no_response=False):
+        sub = CFxSubscription(owner_name, subscription_name, no_response)
         sub._owner = owner
-        if sub._owner_name not in self._subscriptions:
-            self._subscriptions[sub._owner_name] = []
-        self._subscriptions[sub._owner_name].append(sub)
+        sub._cfx = self
+        self._subscriptions[(owner_name, subscription_name)] = sub
+        self._subscription_owners.setdefault(owner_name, set()).add(subscription_name)
+        # attach the sinks of any topic subscription that covers the new name
+        for (topic_owner, prefix), sinks in self._topic_sinks.items():
+            if topic_owner == owner_name and subscription_name.startswith(prefix):
+                for sink, (msg_filter, coalesce) in sinks.items():
+                    sub.add_subscriber(sink, msg_filter, coalesce)
         return sub
 
     def remove_subscription(self, sub):
         sub.post_update("SUBSCRIPTION_SOURCE_TERMINATED")
-        if sub._owner_name not in self._subscriptions:
+        if sub._owner_name not in self._subscription_owners:
             raise NameError("Failed to remove subscription source \"{}\"."
                             " No such provider name exists."
                             .format(sub._owner_name))
-        self._subscriptions[sub._owner_name].remove(sub)
+        self._subscriptions.pop((sub._owner_name, sub._subscription_name), None)
+        self._subscription_owners[sub._owner_name].discard(sub._subscription_name)
 
     def find_subscription(self, owner_name, subscription_name):
-        sub = None
-        if owner_name not in self._subscriptions:
+        if owner_name not in self._subscription_owners:
             raise NameError("The specified subscription provider {} was not found."
                             .format(owner_name))
-        for sub in self._subscriptions[owner_name]:
-            if sub._subscription_name == subscription_name:
-                return sub
-        return None
+        return self._subscriptions.get((owner_name, subscription_name), None)
+
+    def find_topic_subscriptions(self, owner_name, prefix):
+        # the owner's subscriptions whose name begins with prefix
+        if owner_name not in self._subscription_owners:
+            raise NameError("The specified subscription provider {} was not found."
+                            .format(owner_name))
+        return [self._subscriptions[(owner_name, name)]
+                for name in self._subscription_owners[owner_name] if name.startswith(prefix)]
 
     # Caller is the subscription sink
-    def start_subscription(self, owner_name, subscription_name, Sink):
+    def start_subscription(self, owner_name, subscription_name, Sink, msg_filter=None,
+                           coalesce=None):
+        """
+        A subscription_name ending in "*" is a topic subscription, e.g., "LNK_*", it attaches
+        the sink to every current and future subscription of the owner that has the prefix.
+        See CFxSubscription for the msg_filter and coalesce forms.
+        """
+        if subscription_name.endswith("*"):
+            prefix = subscription_name[:-1]
+            for sub in self.find_topic_subscriptions(owner_name, prefix):
+                sub.add_subscriber(Sink, msg_filter, coalesce)
+            self._topic_sinks.setdefault((owner_name, prefix), {})[Sink] = (msg_filter,
+                                                                             coalesce)
+            return
         sub = self.find_subscription(owner_name, subscription_name)
         if sub is not None:
-            sub.add_subscriber(Sink)
+            sub.add_subscriber(Sink, msg_filter, coalesce)
         else:
             raise NameError("The specified subscription name was not found")
 
     def end_subscription(self, owner_name, subscription_name, sink):
+        if subscription_name.endswith("*"):
+            prefix = subscription_name[:-1]
+            self._topic_sinks.get((owner_name, prefix), {}).pop(sink, None)
+            for sub in self.find_topic_subscriptions(owner_name, prefix):
+                sub.remove_subscriber(sink)
+            return
         sub = self.find_subscription(owner_name, subscription_name)
         if sub is not None:
             sub.remove_subscriber(sink)
 
-
 if __name__ == "__main__":
     cf = CFX()
     cf.initialize()
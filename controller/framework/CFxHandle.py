@@ -19,35 +19,64 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import asyncio
+import queue as Queue
 import threading
 import traceback
-import queue as Queue
 import time
-from controller.framework.CBT import CBT
+from controller.framework.CBT import CBT, Notification
+from controller.framework.CFxMetrics import CFxMetrics
+from controller.framework.CFxQueue import CFxQueue
+from controller.framework.CFxTimer import CFxTimer, DeadlineTable
 
 class CFxHandle():
+    TIMER_ACTION = "CFX_TIMER"
+
     def __init__(self, CFxObject):
-        self._cm_queue = Queue.Queue()  # CBT queue
+        self._cm_queue = CFxQueue()  # CBT queue
         self._cm_instance = None
         self._cm_thread = None  # CM worker thread
+        self._cm_task = None  # CM worker coroutine, with the asyncio engine
+        self._worker_ident = None
+        self._wakeup = None
         self._cm_config = None
         self.__cfx_object = CFxObject  # CFx object reference
-        self._exit_event = threading.Event()
-        self._timer_thread = None
+        self._timer = None  # the periodic timer driving the CM's timer_method
         self._timer_interval = 0
         self._timer_loop_cnt = 1
-        self._pending_cbts = {}
+        # CBTs this module has yet to complete, by tag, in RequestTimeout deadline order
+        self._pending_cbts = DeadlineTable()
+        self._pending_lck = threading.Lock()
+        self._request_timeout = 0
         self._owned_cbts = {}
+        self._metrics = CFxMetrics()
+        self._shed_cnt = 0
+        # recycled CBTs, disabled unless CbtPoolSize is configured
+        self._cbt_pool = []
+        self._cbt_pool_size = 0
+        self._released_cbts = []
 
     def submit_cbt(self, cbt):
         # submit CBT to the CFx
         cbt.time_submit = time.time()
         self.__cfx_object.submit_cbt(cbt)
 
-    def create_cbt(self, initiator=None, recipient=None, action=None, params=None):
+    def create_cbt(self, initiator=None, recipient=None, action=None, params=None,
+                   priority=None, no_response=False):
         # create and return a CBT with optional parameters
-        cbt = CBT(initiator, recipient, action, params)
-        self._owned_cbts[cbt.tag] = cbt
+        cbt = None
+        if self._cbt_pool:
+            try:
+                cbt = self._cbt_pool.pop()
+                cbt.reset(initiator, recipient, action, params, priority)
+            except IndexError:
+                cbt = None
+        if cbt is None:
+            cbt = CBT(initiator, recipient, action, params, priority)
+        cbt.no_response = no_response
+        if not no_response:
+            # a no response CBT is released by its recipient and never returns to its owner
+            self._owned_cbts[cbt.tag] = cbt
         cbt.time_create = time.time()
         return cbt
 
@@ -59,6 +88,10 @@ class CFxHandle():
         return cbt
 
     def free_cbt(self, cbt):
+        if isinstance(cbt, Notification):
+            # shared with the other sinks, it is neither owned nor recycled
+            cbt.release()
+            return
         cbt.time_free = time.time()
         if not cbt.child_count == 0:
             raise RuntimeError("Invalid attempt to free a linked CBT")
@@ -67,94 +100,239 @@ class CFxHandle():
             cbt.parent = None
         # explicitly deallocate CBT
         self._owned_cbts.pop(cbt.tag, None)
+        if self._cbt_pool_size > 0 and threading.get_ident() == self._worker_ident:
+            # recycled once the handler that freed it has returned
+            self._released_cbts.append(cbt)
         del cbt
 
+    def _recycle_released_cbts(self):
+        while self._released_cbts:
+            cbt = self._released_cbts.pop()
+            # only a CBT that has run its full course can be reused, anything that may
+            # still be referenced is left to the garbage collector
+            if len(self._cbt_pool) < self._cbt_pool_size and cbt.child_count == 0 and \
+                cbt.completed and cbt.tag not in self._pending_cbts and \
+                cbt.tag not in self._owned_cbts:
+                self._cbt_pool.append(cbt)
+
     def complete_cbt(self, cbt):
         cbt.time_complete = time.time()
         cbt.completed = True
-        self._pending_cbts.pop(cbt.tag, None)
+        self.pop_pending_cbt(cbt.tag)
         if not cbt.child_count == 0:
             raise RuntimeError("Invalid attempt to complete a CBT with outstanding dependencies")
+        if cbt.no_response:
+            # the initiator does not wait on the outcome, free it here instead of returning it
+            self.free_cbt(cbt)
+            return
         self.__cfx_object.submit_cbt(cbt)
 
+    def add_pending_cbt(self, cbt):
+        # track a request that this module has yet to complete
+        submitted = cbt.time_submit if cbt.time_submit is not None else time.time()
+        with self._pending_lck:
+            self._pending_cbts.add(cbt.tag, cbt, submitted + self._request_timeout)
+
+    def get_pending_cbt(self, tag):
+        with self._pending_lck:
+            return self._pending_cbts.get(tag, None)
+
+    def pop_pending_cbt(self, tag):
+        with self._pending_lck:
+            return self._pending_cbts.pop(tag, None)
+
+    def expire_pending_cbts(self, msg="The request has expired"):
+        """
+        Fail and complete every pending CBT that has been outstanding for longer than the
+        RequestTimeout. The cost is proportional to the number of expired entries.
+        """
+        with self._pending_lck:
+            expired = self._pending_cbts.pop_expired(time.time())
+        for _, cbt in expired:
+            cbt.set_response(msg, False)
+            self.complete_cbt(cbt)
+        return len(expired)
+
     def initialize(self):
+        # bound the CBT queue before the module starts generating traffic
+        cfx = self.__cfx_object
+        self._cm_queue.configure(cfx.module_param(self._cm_config, "MaxQueueSize", 0),
+                                 cfx.module_param(self._cm_config, "QueueOverflowPolicy", "Block"),
+                                 cfx.module_param(self._cm_config, "QueueMode", "Priority"))
+        self._cbt_pool_size = int(cfx.module_param(self._cm_config, "CbtPoolSize", 0))
+        self._request_timeout = self.query_param("RequestTimeout") or 0
         # intialize the Controller Module and start it's threads
         self._cm_instance.initialize()
 
-        # create the worker thread, which is started by CFx
-        thread_name = self._cm_instance.__class__.__name__ + "::__worker"
-        self._cm_thread = threading.Thread(target=self.__worker, name=thread_name,
-                                           daemon=False)
+        if self.event_loop is None:
+            # create the worker thread, which is started by CFx
+            thread_name = self._cm_instance.__class__.__name__ + "::__worker"
+            self._cm_thread = threading.Thread(target=self.__worker, name=thread_name,
+                                               daemon=False)
+        else:
+            self._cm_queue.set_wakeup(self._wake_async_worker)
 
         # enable the timer event if the timer_interval is specified
         self._timer_interval = int(self._cm_config.get("TimerInterval", 0))
         if self._timer_interval > 0:
-            # create the timer worker thread, which is started by CFx
-            thread_name = self._cm_instance.__class__.__name__ + "::__timer"
-            self._timer_thread = threading.Thread(target=self.__timer_worker,
-                                                  name=thread_name, daemon=False)
+            self._timer = self.start_timer(self._timer_interval, self._timer_tick,
+                                           periodic=True)
 
     def update_timer_interval(self, interval):
         self._timer_interval = interval
+        if self._timer is not None:
+            # takes effect when the timer is next rearmed
+            self._timer.interval = interval
+
+    @property
+    def event_loop(self):
+        # the asyncio event loop running this module, None when it has a worker thread
+        if self._cm_config.get("Engine") == "Threads":
+            # the module makes blocking calls, it keeps a thread of its own under asyncio
+            return None
+        return self.__cfx_object._event_loop
+
+    def start(self):
+        # start servicing the CBT queue, called by CFx once every module is initialized
+        if self._cm_thread is not None:
+            self._cm_thread.start()
+        else:
+            self._cm_task = asyncio.run_coroutine_threadsafe(self._async_worker(),
+                                                             self.event_loop)
+
+    def join(self):
+        if self._cm_thread is not None:
+            self._cm_thread.join()
+        elif self._cm_task is not None:
+            self._cm_task.result()
+
+    def start_timer(self, interval, callback, *args, periodic=False):
+        """
+        Invoke callback(*args) on this module's worker thread after interval seconds, and
+        every interval seconds thereafter if periodic. Returns the timer for cancel_timer().
+        """
+        timer = CFxTimer(self, callback, args, interval if periodic else 0)
+        return self.__cfx_object._timer_service.schedule(timer, interval)
+
+    def cancel_timer(self, timer):
+        if timer is not None:
+            timer.cancel()
+
+    def post_timer(self, timer):
+        # called by the timer wheel, timer CBTs bypass the queue bound
+        cbt = CBT(self._cm_instance.__class__.__name__, self._cm_instance.__class__.__name__,
+                  CFxHandle.TIMER_ACTION, timer, CBT.PRIORITY_CONTROL)
+        cbt.no_response = True
+        cbt.time_submit = time.time()
+        self._cm_queue.put(cbt, bounded=False)
+
+    def _fire_timer(self, timer):
+        if timer.cancelled:
+            return
+        try:
+            timer.callback(*timer.args)
+        except Exception as err:
+            log_cbt = self.create_cbt(
+                initiator=self._cm_instance.__class__.__name__,
+                recipient="Logger", action="LOG_WARNING",
+                no_response=True,
+                params="Timer Method exception:{0}\n{1}"
+                .format(err, traceback.format_exc()))
+            self.submit_cbt(log_cbt)
+        if timer.interval and not timer.cancelled:
+            self.__cfx_object._timer_service.schedule(timer, timer.interval)
+
+    def _timer_tick(self):
+        self._check_container_bounds()
+        self._cm_instance.timer_method()
+
+    def _dispatch_cbt(self, cbt):
+        # call process_cbt() of the CBT recipient, or run the timer, passing the CBT as an
+        # argument. Shared by the thread and asyncio engines.
+        sample = self._metrics.sample_cbt(cbt)
+        if cbt.request.action == CFxHandle.TIMER_ACTION:
+            self._fire_timer(cbt.request.params)
+            self._metrics.record(sample)
+            return
+        try:
+            if not cbt.completed:
+                self.add_pending_cbt(cbt)
+            self._cm_instance.process_cbt(cbt)
+        except Exception as err:
+            log_cbt = self.create_cbt(
+                initiator=self._cm_instance.__class__.__name__,
+                recipient="Logger", action="LOG_WARNING",
+                no_response=True,
+                params="Process CBT exception:{0}\n{1}\n{2}"
+                .format(err, cbt, traceback.format_exc()))
+            self.submit_cbt(log_cbt)
+            if cbt.request.initiator == self._cm_instance.__class__.__name__:
+                self.free_cbt(cbt)
+            else:
+                cbt.set_response(None, False)
+                self.complete_cbt(cbt)
+        finally:
+            self._metrics.record(sample)
+            self._recycle_released_cbts()
 
     def __worker(self):
-        # get CBT from the local queue and call process_cbt() of the
-        # CBT recipient and passing the CBT as an argument
+        # get CBT from the local queue and dispatch it to the CM
+        self._worker_ident = threading.get_ident()
         while True:
             cbt = self._cm_queue.get()
             # Terminate when CBT is None
             if cbt is None:
                 self._cm_instance.terminate()
                 break
-            else:
-                try:
-                    if not cbt.completed:
-                        self._pending_cbts[cbt.tag] = cbt
-                    self._cm_instance.process_cbt(cbt)
-                except Exception as err:
-                    log_cbt = self.create_cbt(
-                        initiator=self._cm_instance.__class__.__name__,
-                        recipient="Logger", action="LOG_WARNING",
-                        params="Process CBT exception:{0}\n{1}\n{2}"
-                        .format(err, cbt, traceback.format_exc()))
-                    self.submit_cbt(log_cbt)
-                    if cbt.request.initiator == self._cm_instance.__class__.__name__:
-                        self.free_cbt(cbt)
-                    else:
-                        cbt.set_response(None, False)
-                        self.complete_cbt(cbt)
-                finally:
-                    self._cm_queue.task_done()
-
-    def __timer_worker(self):
-        # call the timer_method of each CM every timer_interval seconds
-        while not self._exit_event.wait(self._timer_interval):
+            self._dispatch_cbt(cbt)
+            self._cm_queue.task_done()
+
+    async def _async_worker(self):
+        # asyncio engine counterpart of __worker, it yields to the event loop after each CBT
+        # so the modules sharing the loop are serviced in turn
+        self._worker_ident = threading.get_ident()
+        self._wakeup = asyncio.Event()
+        while True:
+            self._wakeup.clear()
             try:
-                self._check_container_bounds()
-                self._cm_instance.timer_method()
-            except Exception as err:
-                log_cbt = self.create_cbt(
-                    initiator=self._cm_instance.__class__.__name__,
-                    recipient="Logger", action="LOG_WARNING",
-                    params="Timer Method exception:{0}\n{1}"
-                    .format(err, traceback.format_exc()))
-                self.submit_cbt(log_cbt)
+                cbt = self._cm_queue.get(block=False)
+            except Queue.Empty:
+                await self._wakeup.wait()
+                continue
+            if cbt is None:
+                self._cm_instance.terminate()
+                break
+            self._dispatch_cbt(cbt)
+            self._cm_queue.task_done()
+            await asyncio.sleep(0)
+
+    def _wake_async_worker(self):
+        # called by the CBT queue on every put, possibly from a thread outside the event loop
+        if self._wakeup is None:
+            return
+        if threading.get_ident() == self._worker_ident:
+            self._wakeup.set()
+        else:
+            self.__cfx_object._event_loop.call_soon_threadsafe(self._wakeup.set)
 
     def query_param(self, param_name=""):
         pv = self.__cfx_object.query_param(param_name)
         return pv
 
     # Caller is the subscription source
-    def publish_subscription(self, subscription_name):
+    def publish_subscription(self, subscription_name, no_response=False):
         return self.__cfx_object.publish_subscription(self._cm_instance.__class__.__name__,
-                                                      subscription_name, self._cm_instance)
+                                                      subscription_name, self._cm_instance,
+                                                      no_response)
 
     def remove_subscription(self, sub):
-        self.__cfx_object.RemoveSubscriptionPublisher(sub)
+        self.__cfx_object.remove_subscription(sub)
 
     # Caller is the subscription sink
-    def start_subscription(self, owner_name, subscription_name):
-        self.__cfx_object.start_subscription(owner_name, subscription_name, self._cm_instance)
+    def start_subscription(self, owner_name, subscription_name, msg_filter=None,
+                           coalesce=None):
+        self.__cfx_object.start_subscription(owner_name, subscription_name, self._cm_instance,
+                                             msg_filter, coalesce)
 
     def end_subscription(self, owner_name, subscription_name):
         self.__cfx_object.end_subscription(owner_name, subscription_name, self._cm_instance)
@@ -165,12 +343,23 @@ class CFxHandle():
             if plen >= 50:
                 log_cbt = self.create_cbt(initiator=self._cm_instance.__class__.__name__,
                                           recipient="Logger", action="LOG_WARNING",
+                                          no_response=True,
                                           params="_pending_cbts length={0}".format(plen))
                 self.submit_cbt(log_cbt)
             olen = len(self._owned_cbts)
             if olen >= 50:
                 log_cbt = self.create_cbt(initiator=self._cm_instance.__class__.__name__,
                                           recipient="Logger", action="LOG_WARNING",
+                                          no_response=True,
                                           params="_owned_cbts length={0}".format(olen))
                 self.submit_cbt(log_cbt)
+            qstats = self._cm_queue.stats()
+            shed_cnt = qstats["Dropped"] + qstats["Rejected"]
+            if shed_cnt > self._shed_cnt:
+                log_cbt = self.create_cbt(initiator=self._cm_instance.__class__.__name__,
+                                          recipient="Logger", action="LOG_WARNING",
+                                          no_response=True,
+                                          params="CBT queue overloaded {0}".format(qstats))
+                self.submit_cbt(log_cbt)
+            self._shed_cnt = shed_cnt
         self._timer_loop_cnt = self._timer_loop_cnt + 1
@@ -0,0 +1,127 @@
+# ipop-project
+# Copyright 2016, University of Florida
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import bisect
+import threading
+import time
+
+
+class Histogram():
+    """
+    Fixed log2-bucketed latency histogram. Bucket upper bounds start at 10us and double up to
+    roughly 80s; anything larger lands in the overflow bucket.
+    """
+    BOUNDS = [0.00001 * (2 ** i) for i in range(24)]
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(Histogram.BOUNDS) + 1)
+
+    def record(self, value):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        self.buckets[bisect.bisect_left(Histogram.BOUNDS, value)] += 1
+
+    def percentile(self, pct):
+        # returns the upper bound of the bucket holding the requested percentile
+        if self.count == 0:
+            return 0.0
+        rank = pct / 100.0 * self.count
+        seen = 0
+        for idx, num in enumerate(self.buckets):
+            seen += num
+            if seen >= rank and num:
+                if idx < len(Histogram.BOUNDS):
+                    return min(Histogram.BOUNDS[idx], self.max)
+                return self.max
+        return self.max
+
+    def snapshot(self):
+        return {"Count": self.count,
+                "Mean": self.total / self.count if self.count else 0.0,
+                "Max": self.max,
+                "P50": self.percentile(50),
+                "P90": self.percentile(90),
+                "P99": self.percentile(99)}
+
+
+class CFxMetrics():
+    """
+    Per module CBT timing, keyed by op_type and action. Durations are in seconds.
+    QueueWait   - submitted (or completed, for a response) until dequeued by the worker
+    ServiceTime - time spent inside process_cbt
+    EndToEnd    - created until completed, recorded when the response reaches the initiator
+    """
+    def __init__(self):
+        self._lck = threading.Lock()
+        self._histograms = {}
+
+    def _histogram(self, op_type, action, name):
+        key = (op_type, action)
+        hists = self._histograms.get(key)
+        if hists is None:
+            hists = {"QueueWait": Histogram(), "ServiceTime": Histogram(),
+                     "EndToEnd": Histogram()}
+            self._histograms[key] = hists
+        return hists[name]
+
+    @staticmethod
+    def sample_cbt(cbt):
+        """
+        Capture the CBT's identity and queue timings when it is dequeued, before the handler
+        gets a chance to turn a request into a response or free it.
+        """
+        time_dequeue = time.time()
+        op_type = cbt.op_type
+        queued = cbt.time_complete if op_type == "Response" else cbt.time_submit
+        end_to_end = None
+        if op_type == "Response" and cbt.time_create is not None and \
+            cbt.time_complete is not None:
+            end_to_end = cbt.time_complete - cbt.time_create
+        queue_wait = time_dequeue - queued if queued is not None else None
+        return (op_type, cbt.request.action, time_dequeue, queue_wait, end_to_end)
+
+    def record(self, sample):
+        op_type, action, time_dequeue, queue_wait, end_to_end = sample
+        service_time = time.time() - time_dequeue
+        with self._lck:
+            if queue_wait is not None:
+                self._histogram(op_type, action, "QueueWait").record(queue_wait)
+            self._histogram(op_type, action, "ServiceTime").record(service_time)
+            if end_to_end is not None:
+                self._histogram(op_type, action, "EndToEnd").record(end_to_end)
+
+    def snapshot(self):
+        snap = {}
+        with self._lck:
+            for (op_type, action), hists in self._histograms.items():
+                snap["{0}:{1}".format(op_type, action)] = \
+                    {name: hist.snapshot() for name, hist in hists.items() if hist.count}
+        return snap
+
+    def reset(self):
+        with self._lck:
+            self._histograms = {}
@@ -0,0 +1,222 @@
+# ipop-project
+# Copyright 2016, University of Florida
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import queue
+import threading
+from collections import deque
+from controller.framework.CBT import CBT
+
+
+class CFxQueue():
+    """
+    CBT queue feeding a module's worker thread. The number of queued requests can be bounded
+    with MaxQueueSize (0 is unbounded) and QueueOverflowPolicy selects what happens when the
+    bound is reached:
+    Block      - the submitter waits until the worker makes room
+    DropOldest - the oldest, lowest priority queued request is shed to admit the new one
+    Reject     - the new request is shed
+    Responses and the terminating None are always admitted so an overloaded module can still
+    complete the work it has outstanding. Shed requests are handed back to the submitter to be
+    failed.
+    In the default Priority QueueMode each CBT priority class has its own FIFO lane and the
+    worker drains higher classes first. A non-empty lane that has been passed over
+    STARVATION_LIMIT times in a row is serviced next regardless of its class. Fifo QueueMode
+    keeps everything in submission order.
+    """
+    POLICIES = ("Block", "DropOldest", "Reject")
+    MODES = ("Priority", "Fifo")
+    STARVATION_LIMIT = 16
+
+    def __init__(self, max_size=0, policy="Block", mode="Priority"):
+        self._lck = threading.Lock()
+        self._not_empty = threading.Condition(self._lck)
+        self._not_full = threading.Condition(self._lck)
+        self._all_tasks_done = threading.Condition(self._lck)
+        # each lane holds (seq, is_request, cbt), seq is the submission order and is_request
+        # tracks the bound as it was at submission
+        self._lanes = tuple(deque() for _ in range(CBT.PRIORITY_CLASSES))
+        self._skips = [0] * CBT.PRIORITY_CLASSES
+        self._size = 0
+        self._seq = 0
+        # CBTs submitted before the terminating None have a seq below _terminate_seq, and
+        # _terminate_after of them remain to be serviced before None is returned
+        self._terminate_seq = None
+        self._terminate_after = None
+        self._num_requests = 0
+        self._unfinished_tasks = 0
+        self._consumer = None
+        self._wakeup = None
+        self.max_size = 0
+        self.policy = "Block"
+        self.mode = "Priority"
+        self.dropped = 0
+        self.rejected = 0
+        self.configure(max_size, policy, mode)
+
+    def configure(self, max_size=0, policy="Block", mode="Priority"):
+        if policy not in CFxQueue.POLICIES:
+            raise ValueError("Invalid QueueOverflowPolicy {0}, expected one of {1}"
+                             .format(policy, CFxQueue.POLICIES))
+        if mode not in CFxQueue.MODES:
+            raise ValueError("Invalid QueueMode {0}, expected one of {1}"
+                             .format(mode, CFxQueue.MODES))
+        with self._lck:
+            self.max_size = max(int(max_size), 0)
+            self.policy = policy
+            if mode != self.mode:
+                # move anything already waiting into the lanes used by the new mode
+                pending = sorted(item for lane in self._lanes for item in lane)
+                for lane in self._lanes:
+                    lane.clear()
+                self.mode = mode
+                for item in pending:
+                    self._lanes[self._lane(item[2])].append(item)
+            self._not_full.notify_all()
+
+    def set_wakeup(self, wakeup):
+        # callback invoked after every put, used to wake a consumer that is not blocked in get
+        self._wakeup = wakeup
+
+    def _lane(self, cbt):
+        if self.mode == "Fifo":
+            return 0
+        return min(max(cbt.queue_priority, 0), len(self._lanes) - 1)
+
+    def _full(self):
+        return self.max_size > 0 and self._num_requests >= self.max_size
+
+    def _shed_oldest(self):
+        # lower priority traffic is shed ahead of control requests
+        for lane in reversed(self._lanes):
+            for idx, (seq, is_request, queued) in enumerate(lane):
+                if is_request:
+                    del lane[idx]
+                    self._size -= 1
+                    self._serviced(seq)
+                    self._num_requests -= 1
+                    self._unfinished_tasks -= 1
+                    return queued
+        return None
+
+    def _serviced(self, seq):
+        if self._terminate_seq is not None and seq < self._terminate_seq:
+            self._terminate_after -= 1
+
+    def _select_lane(self):
+        selected = None
+        for prio, lane in enumerate(self._lanes):
+            if not lane:
+                self._skips[prio] = 0
+                continue
+            if selected is None:
+                selected = prio
+                continue
+            self._skips[prio] += 1
+            if self._skips[prio] > CFxQueue.STARVATION_LIMIT and \
+                self._skips[selected] <= CFxQueue.STARVATION_LIMIT:
+                selected = prio
+        self._skips[selected] = 0
+        return self._lanes[selected]
+
+    def put(self, cbt, bounded=True):
+        """
+        Enqueue the CBT and return the request that was shed to keep the queue within its
+        bound, or None. Under the Reject policy the shed request is the one passed in. An
+        unbounded put, e.g., a timer, is always admitted and does not count toward the bound.
+        """
+        shed = None
+        is_request = bounded and cbt is not None and cbt.op_type == "Request"
+        with self._lck:
+            if cbt is None:
+                # terminate once everything submitted ahead of it has been serviced
+                if self._terminate_after is None:
+                    self._terminate_seq = self._seq
+                    self._terminate_after = self._size
+            else:
+                if is_request and self._full():
+                    if self.policy == "Reject":
+                        self.rejected += 1
+                        return cbt
+                    if self.policy == "DropOldest":
+                        shed = self._shed_oldest()
+                        self.dropped += 1
+                    elif threading.get_ident() != self._consumer:
+                        # the worker never waits on its own queue as nothing would drain it
+                        while self._full():
+                            self._not_full.wait()
+                self._lanes[self._lane(cbt)].append((self._seq, is_request, cbt))
+                self._seq += 1
+                self._size += 1
+                if is_request:
+                    self._num_requests += 1
+            self._unfinished_tasks += 1
+            self._not_empty.notify()
+        if self._wakeup is not None:
+            self._wakeup()
+        return shed
+
+    def get(self, block=True):
+        with self._lck:
+            self._consumer = threading.get_ident()
+            while not self._size and self._terminate_after is None:
+                if not block:
+                    raise queue.Empty
+                self._not_empty.wait()
+            if self._terminate_after == 0:
+                self._terminate_seq = None
+                self._terminate_after = None
+                return None
+            seq, is_request, cbt = self._select_lane().popleft()
+            self._size -= 1
+            self._serviced(seq)
+            if is_request:
+                self._num_requests -= 1
+                self._not_full.notify()
+            return cbt
+
+    def task_done(self):
+        with self._lck:
+            if self._unfinished_tasks <= 0:
+                raise ValueError("task_done() called too many times")
+            self._unfinished_tasks -= 1
+            if self._unfinished_tasks == 0:
+                self._all_tasks_done.notify_all()
+
+    def join(self):
+        with self._lck:
+            while self._unfinished_tasks:
+                self._all_tasks_done.wait()
+
+    def qsize(self):
+        with self._lck:
+            return self._size
+
+    def stats(self):
+        with self._lck:
+            return {"Length": self._size,
+                    "Lanes": [len(lane) for lane in self._lanes],
+                    "Requests": self._num_requests,
+                    "MaxQueueSize": self.max_size,
+                    "QueueOverflowPolicy": self.policy,
+                    "QueueMode": self.mode,
+                    "Dropped": self.dropped,
+                    "Rejected": self.rejected}
@@ -19,24 +19,138 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import collections
+import collections.abc
+import threading
+import time
+from controller.framework.CBT import Notification
+
 
 class CFxSubscription():
-    def __init__(self, owner_name, subscription_name):
+    def __init__(self, owner_name, subscription_name, no_response=False):
         self._owner_name = owner_name
         self._owner = None
+        self._cfx = None
         self._subscription_name = subscription_name
-        self._subscribers = []
+        # maps each subscriber to its (message filter, coalesce settings), either may be None
+        self._subscribers = {}
+        # recipients of every update as is, and the (recipient, filter, coalesce) entries of
+        # the remaining subscribers, rebuilt when the subscribers change rather than per update
+        self._sink_names = ()
+        self._selective_sinks = ()
+        # updates awaiting delivery to the coalescing subscribers, by recipient then key
+        self._coalesced = {}
+        self._lck = threading.Lock()
+        # notifications are not completed back to the owner when set
+        self._no_response = no_response
 
     """
-    sink must be an instance of a controller module
+    sink must be an instance of a controller module. msg_filter selects the updates delivered to
+    it, either a callable that is passed the update and returns True to accept it, or a dict of
+    field values the update must match, where a set, frozenset, list or tuple value matches any
+    of its members, e.g., {"UpdateType": {"LnkEvConnected", "LnkEvRemoved"}}.
+    coalesce, e.g., {"Keys": ["OverlayId", "PeerId"], "Window": 0.1}, opts the sink into
+    receiving its updates as a batch, a list delivered in one CBT at most Window seconds after
+    the first update it holds. The batch groups the updates by the values of their Keys fields,
+    keeping the order in which they were posted for each key, and drops an update that repeats
+    the previous one for its key.
     """
 
-    def add_subscriber(self, sink):
-        self._subscribers.append(sink)
+    def add_subscriber(self, sink, msg_filter=None, coalesce=None):
+        if coalesce is not None:
+            coalesce = (tuple(coalesce.get("Keys", ())), float(coalesce["Window"]))
+        self._subscribers[sink] = (CFxSubscription.compile_filter(msg_filter), coalesce)
+        self._index_subscribers()
 
     def remove_subscriber(self, sink):
-        self._subscribers.remove(sink)
+        self._subscribers.pop(sink, None)
+        self._index_subscribers()
+        with self._lck:
+            self._coalesced.pop(sink.__class__.__name__, None)
+
+    def _index_subscribers(self):
+        subs = sorted(self._subscribers.items(), key=lambda item: item[0].__class__.__name__)
+        self._selective_sinks = tuple((sub.__class__.__name__, accept, coalesce)
+                                      for sub, (accept, coalesce) in subs
+                                      if accept is not None or coalesce is not None)
+        self._sink_names = tuple(sub.__class__.__name__ for sub, (accept, coalesce) in subs
+                                 if accept is None and coalesce is None)
+
+    @staticmethod
+    def compile_filter(msg_filter):
+        # returns the filter as a predicate on the update
+        if msg_filter is None or callable(msg_filter):
+            return msg_filter
+        fields = []
+        for key, val in msg_filter.items():
+            if isinstance(val, (set, frozenset, list, tuple)):
+                fields.append((key, frozenset(val), True))
+            else:
+                fields.append((key, val, False))
+        fields = tuple(fields)
+
+        def accept(msg):
+            if not isinstance(msg, collections.abc.Mapping):
+                return False
+            for key, val, is_member in fields:
+                if key not in msg:
+                    return False
+                if is_member:
+                    if msg[key] not in val:
+                        return False
+                elif msg[key] != val:
+                    return False
+            return True
+        return accept
 
     def post_update(self, msg):
-        for sink in self._subscribers:
-            self._owner.register_cbt(sink.__class__.__name__, self._subscription_name, msg)
+        sink_names = self._sink_names
+        if self._selective_sinks:
+            # filters are applied before any CBT is created
+            accepted = []
+            for sink_name, accept, coalesce in self._selective_sinks:
+                if accept is not None and not accept(msg):
+                    continue
+                if coalesce is None:
+                    accepted.append(sink_name)
+                else:
+                    self._coalesce(sink_name, coalesce, msg)
+            if accepted:
+                sink_names = sink_names + tuple(accepted)
+        self._deliver(msg, sink_names)
+
+    def _coalesce(self, sink_name, coalesce, msg):
+        keys, window = coalesce
+        key = None
+        if isinstance(msg, collections.abc.Mapping):
+            key = tuple(msg.get(field) for field in keys)
+        with self._lck:
+            pending = self._coalesced.get(sink_name)
+            arm = pending is None
+            if arm:
+                pending = collections.OrderedDict()
+                self._coalesced[sink_name] = pending
+            updates = pending.setdefault(key, [])
+            if not updates or updates[-1] != msg:
+                updates.append(msg)
+        if arm:
+            # flushed on the owner's worker thread once the window closes
+            self._owner._cfx_handle.start_timer(window, self._flush, sink_name)
+
+    def _flush(self, sink_name):
+        with self._lck:
+            pending = self._coalesced.pop(sink_name, None)
+        if pending:
+            self._deliver([msg for updates in pending.values() for msg in updates],
+                          (sink_name,))
+
+    def _deliver(self, msg, sink_names):
+        if not self._no_response:
+            # each sink's response is returned to the owner on its own CBT
+            for sink_name in sink_names:
+                self._owner.register_cbt(sink_name, self._subscription_name, msg)
+            return
+        if sink_names:
+            cbt = Notification(self._owner_name, self._subscription_name, msg)
+            cbt.time_create = time.time()
+            self._cfx.broadcast_cbt(cbt, sink_names)
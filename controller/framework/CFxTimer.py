@@ -0,0 +1,220 @@
+# ipop-project
+# Copyright 2016, University of Florida
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import heapq
+import math
+import threading
+import time
+
+
+class CFxTimer():
+    """
+    A one-shot or periodic timer. When it expires the timer is posted to its owning module's
+    CBT queue and the callback is invoked on that module's worker thread.
+    """
+    __slots__ = ("owner", "callback", "args", "interval", "expiry_tick", "cancelled")
+
+    def __init__(self, owner, callback, args=(), interval=0):
+        self.owner = owner
+        self.callback = callback
+        self.args = args
+        self.interval = interval
+        self.expiry_tick = 0
+        self.cancelled = False
+
+    def __repr__(self):
+        return "CFxTimer<callback=%s, interval=%s, expiry_tick=%d, cancelled=%r>" % (
+            getattr(self.callback, "__qualname__", self.callback), self.interval,
+            self.expiry_tick, self.cancelled)
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerWheel():
+    """
+    Hierarchical timing wheel shared by all modules. Each of the LEVELS wheels has SLOTS
+    buckets and a bucket at level n spans SLOTS^n ticks. A timer is filed in the lowest level
+    that covers its remaining ticks and is moved down a level each time the wheel beneath
+    completes a revolution, so scheduling and cancelling are O(1) and a tick only touches the
+    timers that are due. Expired timers are handed to their owner's post_timer().
+    """
+    SLOTS = 64
+    LEVELS = 4
+
+    def __init__(self, resolution=0.25):
+        self._resolution = float(resolution)
+        self._wheels = [[[] for _ in range(TimerWheel.SLOTS)] for _ in range(TimerWheel.LEVELS)]
+        self._current_tick = 0
+        self._start_time = time.monotonic()
+        self._lck = threading.Lock()
+        self._exit_event = threading.Event()
+        self._thread = threading.Thread(target=self.__ticker, name="CFx::__timer_wheel",
+                                        daemon=False)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._exit_event.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def schedule(self, timer, delay):
+        # the timer expires on the first tick at or after delay seconds from now. A cancelled
+        # timer stays cancelled, a periodic timer cancelled while it is being rearmed included
+        ticks = max(1, int(math.ceil(delay / self._resolution - 1e-9)))
+        with self._lck:
+            timer.expiry_tick = self._current_tick + ticks
+            self._file(timer)
+        return timer
+
+    def _file(self, timer):
+        remaining = timer.expiry_tick - self._current_tick
+        expiry = timer.expiry_tick
+        for level in range(TimerWheel.LEVELS):
+            if remaining < TimerWheel.SLOTS ** (level + 1):
+                break
+        else:
+            # beyond the range of the top wheel, park it in the farthest bucket from where it
+            # is refiled when that bucket is cascaded
+            expiry = self._current_tick + TimerWheel.SLOTS ** TimerWheel.LEVELS - 1
+        slot = (expiry // TimerWheel.SLOTS ** level) % TimerWheel.SLOTS
+        self._wheels[level][slot].append(timer)
+
+    def _cascade(self, level):
+        # move the timers in the current bucket of this level down to the levels beneath it
+        slot = (self._current_tick // TimerWheel.SLOTS ** level) % TimerWheel.SLOTS
+        bucket = self._wheels[level][slot]
+        self._wheels[level][slot] = []
+        for timer in bucket:
+            if not timer.cancelled:
+                self._file(timer)
+        return slot
+
+    def _advance(self):
+        # process one tick, returning the timers that expired on it
+        with self._lck:
+            self._current_tick += 1
+            for level in range(1, TimerWheel.LEVELS):
+                if self._current_tick % TimerWheel.SLOTS ** level != 0:
+                    break
+                self._cascade(level)
+            slot = self._current_tick % TimerWheel.SLOTS
+            bucket = self._wheels[0][slot]
+            self._wheels[0][slot] = []
+            expired = []
+            for timer in bucket:
+                if timer.cancelled:
+                    continue
+                if timer.expiry_tick <= self._current_tick:
+                    expired.append(timer)
+                else:
+                    self._file(timer)
+            return expired
+
+    def __ticker(self):
+        while not self._exit_event.is_set():
+            target_tick = int((time.monotonic() - self._start_time) / self._resolution)
+            while self._current_tick < target_tick:
+                for timer in self._advance():
+                    timer.owner.post_timer(timer)
+            next_tick_time = self._start_time + (self._current_tick + 1) * self._resolution
+            self._exit_event.wait(max(0, next_tick_time - time.monotonic()))
+
+
+class DeadlineTable():
+    """
+    Entries keyed by tag, each with a deadline, that are taken out in deadline order. A
+    (deadline, tag) min-heap orders them and the heap entries of removed or rescheduled tags
+    are discarded lazily as they surface, so pop_expired is proportional to the number of
+    expired entries. It is not synchronized, the owner serializes access.
+    """
+    def __init__(self):
+        self._entries = {}
+        self._deadlines = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, tag):
+        return tag in self._entries
+
+    def add(self, tag, value, deadline):
+        # replaces any entry for tag, which then expires at the new deadline
+        self._entries[tag] = (deadline, value)
+        heapq.heappush(self._deadlines, (deadline, tag))
+        if len(self._deadlines) > 2 * len(self._entries) + 64:
+            # too many stale heap entries, rebuild from the entries that remain
+            self._deadlines = [(entry[0], key) for key, entry in self._entries.items()]
+            heapq.heapify(self._deadlines)
+
+    def get(self, tag, default=None):
+        entry = self._entries.get(tag)
+        return default if entry is None else entry[1]
+
+    def pop(self, tag, default=None):
+        entry = self._entries.pop(tag, None)
+        return default if entry is None else entry[1]
+
+    def values(self):
+        return [entry[1] for entry in self._entries.values()]
+
+    def clear(self):
+        self._entries.clear()
+        self._deadlines = []
+
+    def pop_expired(self, now):
+        """ Removes and returns the (tag, value) of every entry whose deadline is <= now """
+        expired = []
+        while self._deadlines and self._deadlines[0][0] <= now:
+            deadline, tag = heapq.heappop(self._deadlines)
+            entry = self._entries.get(tag)
+            if entry is not None and entry[0] == deadline:
+                del self._entries[tag]
+                expired.append((tag, entry[1]))
+        return expired
+
+
+class LoopTimerService():
+    """
+    Timer service used by the asyncio engine, timers are scheduled with the event loop's
+    call_later and posted to their owner's queue when they expire.
+    """
+    def __init__(self, loop):
+        self._loop = loop
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def schedule(self, timer, delay):
+        # call_later is not thread safe and timers are also started outside the loop
+        self._loop.call_soon_threadsafe(self._loop.call_later, delay, self._expire, timer)
+        return timer
+
+    @staticmethod
+    def _expire(timer):
+        if not timer.cancelled:
+            timer.owner.post_timer(timer)
@@ -19,13 +19,77 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import logging
 from abc import ABCMeta, abstractmethod
 
+# Name of the python logger the Logger module attaches its queue handler to
+LOGGER_NAME = "IPOP"
+LOG_LEVELS = {"LOG_DEBUG": logging.DEBUG,
+              "LOG_INFO": logging.INFO,
+              "LOG_WARNING": logging.WARNING,
+              "LOG_ERROR": logging.ERROR}
+
+
+class LazyArg():
+    """
+    A log argument that is computed only when the log level is enabled, e.g.,
+    LazyArg(str, self) for a state dump. Any other argument is logged as is, callable or not.
+    """
+    __slots__ = ("func", "args")
+
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+
+    def resolve(self):
+        return self.func(*self.args)
+
+
+def request_handler(*actions):
+    """
+    Marks a ControllerModule method as the handler for Request CBTs carrying any of the
+    specified actions.
+    """
+    def decorator(func):
+        keys = getattr(func, "_cbt_handler_keys", [])
+        func._cbt_handler_keys = keys + [("Request", action) for action in actions]
+        return func
+    return decorator
+
+
+def response_handler(*actions):
+    """
+    Marks a ControllerModule method as the handler for Response CBTs to requests carrying any
+    of the specified actions.
+    """
+    def decorator(func):
+        keys = getattr(func, "_cbt_handler_keys", [])
+        func._cbt_handler_keys = keys + [("Response", action) for action in actions]
+        return func
+    return decorator
+
+
+class CBTHandlerRegistry(type):
+    """
+    Builds the (op_type, action) -> handler table once, when each ControllerModule class is
+    created. Handlers declared in a base class are inherited and a subclass that overrides the
+    method by name replaces the registered handler.
+    """
+    def __init__(cls, name, bases, namespace):
+        super(CBTHandlerRegistry, cls).__init__(name, bases, namespace)
+        handler_names = {}
+        for klass in reversed(cls.__mro__):
+            for attr_name, attr in vars(klass).items():
+                for key in getattr(attr, "_cbt_handler_keys", ()):
+                    handler_names[key] = attr_name
+        cls._cbt_handlers = {key: getattr(cls, attr_name)
+                             for key, attr_name in handler_names.items()}
+
 
 # abstract ControllerModule (CM) class
 # all CM implementations inherit the variables declared here
 # all CM implementations must override the abstract methods declared here
-class ControllerModule():
+class ControllerModule(metaclass=CBTHandlerRegistry):
 
     __metaclass__ = ABCMeta
 
@@ -34,14 +98,24 @@ class ControllerModule():
         self._cfx_handle = cfx_handle
         self._cm_config = module_config
         self._module_name = module_name
+        self._logger = logging.getLogger(LOGGER_NAME)
 
     @abstractmethod
     def initialize(self):
         pass
 
-    @abstractmethod
     def process_cbt(self, cbt):
-        pass
+        """
+        Dispatch the CBT to the handler registered for its (op_type, action) pair. CBTs without a
+        registered handler go to req_handler_default or resp_handler_default.
+        """
+        handler = self._cbt_handlers.get((cbt.op_type, cbt.request.action))
+        if handler is not None:
+            handler(self, cbt)
+        elif cbt.op_type == "Request":
+            self.req_handler_default(cbt)
+        else:
+            self.resp_handler_default(cbt)
 
     @abstractmethod
     def timer_method(self):
@@ -73,19 +147,39 @@ class ControllerModule():
         cbt.set_response(log, False)
         self.complete_cbt(cbt)
 
+    def resp_handler_default(self, cbt):
+        """
+        Free the response and, if it was the last outstanding child of a linked CBT, complete the
+        parent with the child's result.
+        """
+        parent_cbt = cbt.parent
+        cbt_data = cbt.response.data
+        cbt_status = cbt.response.status
+        self.free_cbt(cbt)
+        if (parent_cbt is not None and parent_cbt.child_count == 1):
+            parent_cbt.set_response(cbt_data, cbt_status)
+            self.complete_cbt(parent_cbt)
+
     # create and submit CBT mask method
-    def register_cbt(self, _recipient, _action, _params=None):
+    def register_cbt(self, _recipient, _action, _params=None, _priority=None,
+                     _no_response=False):
+        if _recipient == "Logger" and _action in LOG_LEVELS:
+            if self._log_fast(_action, _params):
+                return None
+            _no_response = True
         cbt = self._cfx_handle.create_cbt(
             initiator=self._module_name,
             recipient=_recipient,
             action=_action,
-            params=_params
+            params=_params,
+            priority=_priority,
+            no_response=_no_response
         )
         self._cfx_handle.submit_cbt(cbt)
         return cbt
 
-    def create_cbt(self, initiator, recipient, action, params=None):
-        return self._cfx_handle.create_cbt(initiator, recipient, action, params)
+    def create_cbt(self, initiator, recipient, action, params=None, priority=None):
+        return self._cfx_handle.create_cbt(initiator, recipient, action, params, priority)
 
     def create_linked_cbt(self, parent):
         return self._cfx_handle.create_linked_cbt(parent)
@@ -99,5 +193,40 @@ class ControllerModule():
     def submit_cbt(self, cbt):
         self._cfx_handle.submit_cbt(cbt)
 
+    def _log_fast(self, level, params):
+        """
+        Hand the log request directly to the Logger module's queue handler, skipping the CBT
+        round trip. Returns False when the fast path is unavailable, i.e., the Logger has not
+        been initialized, so the caller falls back to a LOG_* CBT.
+        """
+        lvl = LOG_LEVELS[level]
+        if not self._logger.handlers:
+            return False
+        if self._logger.isEnabledFor(lvl):
+            if isinstance(params, tuple):
+                self._logger.log(lvl, "%s: " + params[0], self._module_name,
+                                 *ControllerModule._resolve_log_args(params[1]))
+            else:
+                self._logger.log(lvl, "%s: %s", self._module_name, params)
+        return True
+
+    @staticmethod
+    def _resolve_log_args(args):
+        # deferred arguments are evaluated on the caller's thread so the state they capture is
+        # consistent, and only once the level check has passed
+        return tuple(arg.resolve() if isinstance(arg, LazyArg) else arg for arg in args)
+
     def log(self, level, msg, *args):
-        self.register_cbt("Logger", level, _params=(msg, args))
+        """
+        Log msg % args at the LOG_* level. An argument wrapped in a LazyArg is evaluated only
+        when the level is enabled.
+        """
+        lvl = LOG_LEVELS.get(level)
+        if lvl is not None and self._logger.handlers:
+            # filtered here, before any formatting or CBT allocation takes place
+            if self._logger.isEnabledFor(lvl):
+                self._logger.log(lvl, "%s: " + msg, self._module_name,
+                                 *ControllerModule._resolve_log_args(args))
+            return
+        self.register_cbt("Logger", level,
+                          _params=(msg, ControllerModule._resolve_log_args(args)))
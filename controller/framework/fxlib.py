@@ -30,6 +30,18 @@ CONFIG = {
         "IpopVersion": IPOP_VER_REL,
         "Model": "Default",
         "RequestTimeout": 120,
+        "TimerResolution": 0.25,    # Timer service tick in seconds
+        # <Threads>/<asyncio>, how the modules are serviced. With asyncio the modules share a
+        # single event loop thread, so a blocking call in one stalls them all. A module that
+        # makes blocking calls sets its own "Engine": "Threads" to keep a worker thread, and a
+        # bounded CBT queue cannot use the Block overflow policy, which would block the loop.
+        "Engine": "Threads",
+        # Defaults for every module's CBT queue and CBT pool, a module's own section may
+        # override them
+        "MaxQueueSize": 0,              # Max queued requests, 0 is unbounded
+        "QueueOverflowPolicy": "Block", # <Block>/<DropOldest>/<Reject> once MaxQueueSize is hit
+        "QueueMode": "Priority",        # <Priority>/<Fifo> order of servicing queued CBTs
+        "CbtPoolSize": 0,               # Max recycled CBTs kept per module, 0 disables it
     },
     "Logger": {
         "Enabled": True,
@@ -47,6 +59,7 @@ CONFIG = {
         "TimerInterval": 30,                # Timer thread interval
         "WebServiceAddress": ":5000",       # Visualizer webservice URL
         "NodeName": "",                     # Node Name as seen from the UI
+        "Engine": "Threads",                # Blocking HTTP requests, never on the event loop
         "Dependencies": ["Logger"]
     },
     "TincanInterface": {
@@ -59,6 +72,25 @@ CONFIG = {
         "SndServiceAddress6": "::1",
         "CtrlRecvPort": 5801,               # Controller Listening Port
         "CtrlSendPort": 5800,               # Tincan Listening Port
+        "BatchWindow": 0,                   # Secs to batch control messages, 0 to disable
+        "MaxBatchSize": 32,                 # Max control messages in a batched datagram
+        "MaxBatchBytes": 16384,             # Max size of a batched datagram
+        # Threads decoding Tincan responses. Above 1, responses may complete out of order, and
+        # responses are never ordered relative to notifications, which have their own thread
+        "DecoderPoolSize": 1,
+        "RcvBufferSize": 1048576,           # Listening socket receive buffer in bytes
+        "Framing": "json",                  # Control framing to request, json or msgpack
+        "Transport": "udp",                 # Control channel, udp or unix
+        "SocketType": "dgram",              # Unix socket type, dgram or seqpacket
+        "CtrlRecvPath": "/run/ipop/ctrl.sock",      # Controller Unix socket path, in a
+        "CtrlSendPath": "/run/ipop/tincan.sock",    # private directory, and Tincan's
+        "UnixMaxReadSize": 1048576,         # Max Tincan message size on the unix transport
+        "ConnectRetryInterval": 1,          # Secs between attempts to reach Tincan, seqpacket
+        "RetransmitTimeout": 5,             # Secs to await a response before resending
+        "MaxRetransmits": 2,                # Resends of an idempotent request before it is
+                                            # failed, other requests are not resent and fail
+                                            # after the same total wait
+        "MaxInFlight": 1024,                # Max requests awaiting a Tincan response
         "Dependencies": ["Logger"]
     },
     "Signal": {
@@ -66,7 +98,8 @@ CONFIG = {
         "TimerInterval": 30,
         "CacheExpiry": 30,          # Min duration an entry remains in the JID cache in seconds
         "Dependencies": ["Logger"],
-        "PresenceInterval": 30      # seconds between presence broadcast
+        "PresenceInterval": 30,     # seconds between presence broadcast
+        "Engine": "Threads"         # Blocking XMPP sends, never on the event loop
     },
     "LinkManager": {
         "Enabled": True,
@@ -78,6 +111,7 @@ CONFIG = {
         "Enabled": True,
         "TimerInterval": 30,
         "PeerDiscoveryCoalesce": 3,
+        "TunnelEventCoalesceWindow": 0,    # seconds, 0 delivers each tunnel event on arrival
         "ExclusionBaseInterval": 240,
         "MaxSuccessors": 2,
         "MaxOnDemandEdges": 1,
@@ -90,10 +124,12 @@ CONFIG = {
         "TimerInterval": 200,
         "ServerAddress": "metrics.ipop-project.org",
         "ServerPort": 8081,
+        "Engine": "Threads",        # Blocking HTTP requests, never on the event loop
         "Dependencies": ["Logger", "Signal"]
     },
     "BridgeController": {
         "Enabled": True,
+        "Engine": "Threads",        # Blocking shell commands, never on the event loop
         "Dependencies": ["Logger", "LinkManager"]
     }
 }
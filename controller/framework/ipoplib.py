@@ -22,108 +22,6 @@
 import subprocess
 
 
-CTL_CREATE_CTRL_LINK = {
-    "IPOP": {
-        "ProtocolVersion": 5,
-        "TransactionId": 0,
-        "ControlType": "TincanRequest",
-        "Request": {
-            "Command": "CreateCtrlRespLink",
-            "AddressFamily": "af_inetv6",
-            "Protocol": "proto_datagram",
-            "IP": "::1",
-            "Port": 5801
-        }
-    }
-}
-CTL_CONFIGURE_LOGGING = {
-    "IPOP": {
-        "ProtocolVersion": 5,
-        "TransactionId": 0,
-        "ControlType": "TincanRequest",
-        "Request": {
-            "Command": "ConfigureLogging",
-            "Level": "DEBUG",
-            "Device": "All",
-            "Directory": "./logs/",
-            "Filename": "tincan_log",
-            "MaxArchives": 10,
-            "MaxFileSize": 1048576,
-            "ConsoleLevel": "DEBUG"
-        }
-    }
-}
-CTL_QUERY_TUNNEL_INFO = {
-    "IPOP": {
-        "ProtocolVersion": 5,
-        "TransactionId": 0,
-        "ControlType": "TincanRequest",
-        "Request": {
-            "Command": "QueryOverlayInfo",
-            "OverlayId": "",
-            "TunnelId": ""
-        }
-    }
-}
-CTL_CREATE_TUNNEL = {
-    "IPOP": {
-        "ProtocolVersion": 5,
-        "ControlType": "TincanRequest",
-        "TransactionId": 0,
-        "Request": {
-            "Command": "CreateTunnel",
-            "OverlayId": "",
-            "NodeId": "",
-            "TunnelId": "",
-            "TapName": "",
-            "StunServers": [],
-            "TurnServers": [],
-            "Type": "",
-        }
-    }
-}
-CTL_CREATE_LINK = {
-    "IPOP": {
-        "ProtocolVersion": 5,
-        "TransactionId": 0,
-        "ControlType": "TincanRequest",
-        "Request": {
-            "Command": "CreateLink",
-            "OverlayId": "",
-            "TunnelId": "",
-            "LinkId": "",
-            "PeerInfo": {
-                "UID": "",
-                "MAC": "",
-                "FPR": ""
-            }
-        }
-    }
-}
-CTL_REMOVE_TUNNEL = {
-    "IPOP": {
-        "ProtocolVersion": 5,
-        "TransactionId": 0,
-        "ControlType": "TincanRequest",
-        "Request": {
-            "Command": "RemoveTunnel",
-            "OverlayId": "",
-            "TunnelId": ""
-        }
-    }
-}
-CTL_REMOVE_LINK = {
-    "IPOP": {
-        "ProtocolVersion": 5,
-        "TransactionId": 0,
-        "ControlType": "TincanRequest",
-        "Request": {
-            "Command": "RemoveLink",
-            "OverlayId": "",
-            "LinkId": ""
-        }
-    }
-}
 RESP = {
     "IPOP": {
         "ProtocolVersion": 5,
@@ -137,29 +35,6 @@ RESP = {
         }
     }
 }
-CTL_QUERY_LINK_STATS = {
-    "IPOP": {
-        "ProtocolVersion": 5,
-        "TransactionId": 0,
-        "ControlType": "TincanRequest",
-        "Request": {
-            "Command": "QueryLinkStats",
-            "TunnelIds" : []
-        }
-    }
-}
-CTL_QUERY_CAS = {
-    "IPOP": {
-        "ProtocolVersion": 5,
-        "TransactionId": 0,
-        "ControlType": "TincanRequest",
-        "Request": {
-            "Command": "QueryCandidateAddressSet",
-            "OverlayId": "",
-            "LinkId": ""
-        }
-    }
-}
 
 
 def ip4_a2hex(ipstr):
@@ -0,0 +1,244 @@
+# ipop-project
+# Copyright 2016, University of Florida
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+# Tincan control message encoding. Each encoder builds a fresh message from the request's
+# params and the fastest JSON library available serializes it directly to bytes. Once the
+# control link negotiates it, the same messages are instead carried as length-prefixed msgpack.
+import json
+import struct
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+SERIALIZERS = {}
+try:
+    import orjson
+    SERIALIZERS["orjson"] = (orjson.dumps, orjson.loads)
+except ImportError:
+    pass
+try:
+    import ujson
+    SERIALIZERS["ujson"] = (lambda obj: ujson.dumps(obj).encode("utf-8"), ujson.loads)
+except ImportError:
+    pass
+try:
+    import simplejson
+    SERIALIZERS["simplejson"] = (lambda obj: simplejson.dumps(obj).encode("utf-8"),
+                                 lambda data: simplejson.loads(data.decode("utf-8")))
+except ImportError:
+    pass
+SERIALIZERS["json"] = (lambda obj: json.dumps(obj).encode("utf-8"),
+                       lambda data: json.loads(data.decode("utf-8")))
+
+# the serializer in use, the first available in order of preference
+SERIALIZER = next(name for name in ("orjson", "ujson", "simplejson", "json")
+                  if name in SERIALIZERS)
+dumps, loads = SERIALIZERS[SERIALIZER]
+
+PROTOCOL_VERSION = 5
+# the ProtocolVersion of messages in binary framing, Tincan acknowledges a request for the
+# msgpack framing by answering create_ctrl_link with this version
+BINARY_PROTOCOL_VERSION = 6
+
+FRAMING_JSON = "json"
+FRAMING_MSGPACK = "msgpack"
+FRAMINGS = (FRAMING_JSON, FRAMING_MSGPACK) if msgpack is not None else (FRAMING_JSON,)
+
+# a binary frame is a 4 byte big endian payload length followed by the msgpack payload, the
+# leading byte is 0 for any frame that fits a datagram which sets it apart from JSON
+_FRAME_HDR = struct.Struct(">I")
+
+
+def _request(tag, request):
+    return {"IPOP": {"ProtocolVersion": PROTOCOL_VERSION, "TransactionId": tag,
+                     "ControlType": "TincanRequest", "Request": request}}
+
+
+def create_ctrl_link(tag, params):
+    if params.get("AddressFamily") == "af_unix":
+        # the controller's socket path, or none to respond on the seqpacket connection
+        msg = _request(tag, {"Command": "CreateCtrlRespLink", "AddressFamily": "af_unix",
+                             "Protocol": params.get("Protocol", "proto_datagram")})
+        if params.get("Path"):
+            msg["IPOP"]["Request"]["Path"] = params["Path"]
+    else:
+        msg = _request(tag, {"Command": "CreateCtrlRespLink",
+                             "AddressFamily": params.get("AddressFamily", "af_inet"),
+                             "Protocol": "proto_datagram",
+                             "IP": params["IP"],
+                             "Port": 5801 if params.get("Port") is None else params["Port"]})
+    if params.get("Framing", FRAMING_JSON) != FRAMING_JSON:
+        # sent as JSON, a Tincan that does not know the field ignores it and stays on JSON
+        msg["IPOP"]["Request"]["Framing"] = params["Framing"]
+    return msg
+
+
+def configure_logging(tag, params):
+    # params is the Logger's configuration, or None for Tincan's defaults
+    if params is None:
+        return _request(tag, {"Command": "ConfigureLogging", "Level": "DEBUG",
+                              "Device": "All", "Directory": "./logs/",
+                              "Filename": "tincan_log", "MaxArchives": 10,
+                              "MaxFileSize": 1048576, "ConsoleLevel": "DEBUG"})
+    return _request(tag, {"Command": "ConfigureLogging",
+                          "Level": params["LogLevel"],
+                          "Device": params["Device"],
+                          "Directory": params["Directory"],
+                          "Filename": params["TincanLogFileName"],
+                          "MaxArchives": params["MaxArchives"],
+                          "MaxFileSize": params["MaxFileSize"],
+                          "ConsoleLevel": params["ConsoleLevel"]})
+
+
+def create_link(tag, params):
+    node_data = params["NodeData"]
+    return _request(tag, {"Command": "CreateLink",
+                          "OverlayId": params["OverlayId"],
+                          "TunnelId": params["TunnelId"],
+                          "NodeId": params.get("NodeId"),
+                          "LinkId": params["LinkId"],
+                          "PeerInfo": {"UID": node_data.get("UID"),
+                                       "MAC": node_data.get("MAC"),
+                                       "CAS": node_data.get("CAS"),
+                                       "FPR": node_data.get("FPR")},
+                          # Optional overlay data to create overlay on demand
+                          "StunServers": params.get("StunServers"),
+                          "TurnServers": params.get("TurnServers"),
+                          "Type": params["Type"],
+                          "TapName": params.get("TapName"),
+                          "IgnoredNetInterfaces": params.get("IgnoredNetInterfaces")})
+
+
+def create_tunnel(tag, params):
+    return _request(tag, {"Command": "CreateTunnel",
+                          "OverlayId": params["OverlayId"],
+                          "NodeId": params.get("NodeId"),
+                          "TunnelId": params["TunnelId"],
+                          "TapName": params["TapName"],
+                          "StunServers": params["StunServers"],
+                          "TurnServers": params.get("TurnServers"),
+                          "Type": params["Type"],
+                          "IgnoredNetInterfaces": params.get("IgnoredNetInterfaces")})
+
+
+def query_cas(tag, params):
+    return _request(tag, {"Command": "QueryCandidateAddressSet",
+                          "OverlayId": params["OverlayId"],
+                          "LinkId": params["LinkId"]})
+
+
+def query_link_stats(tag, params):
+    # params is the list of tunnel ids
+    return _request(tag, {"Command": "QueryLinkStats", "TunnelIds": params})
+
+
+def query_tunnel_info(tag, params):
+    return _request(tag, {"Command": "QueryOverlayInfo",
+                          "OverlayId": params["OverlayId"],
+                          "TunnelId": ""})
+
+
+def remove_tunnel(tag, params):
+    return _request(tag, {"Command": "RemoveTunnel",
+                          "OverlayId": params["OverlayId"],
+                          "TunnelId": params["TunnelId"]})
+
+
+def remove_link(tag, params):
+    return _request(tag, {"Command": "RemoveLink",
+                          "OverlayId": params["OverlayId"],
+                          "TunnelId": params["TunnelId"],
+                          "LinkId": params["LinkId"]})
+
+
+# message builders by the TincanInterface CBT action they carry
+ENCODERS = {
+    "TCI_CREATE_CTRL_LINK": create_ctrl_link,
+    "TCI_CONFIGURE_LOGGING": configure_logging,
+    "TCI_CREATE_LINK": create_link,
+    "TCI_CREATE_TUNNEL": create_tunnel,
+    "TCI_QUERY_CAS": query_cas,
+    "TCI_QUERY_LINK_STATS": query_link_stats,
+    "TCI_QUERY_TUNNEL_INFO": query_tunnel_info,
+    "TCI_REMOVE_TUNNEL": remove_tunnel,
+    "TCI_REMOVE_LINK": remove_link,
+}
+
+# requests that leave Tincan unchanged when repeated, only these are retransmitted
+IDEMPOTENT_ACTIONS = frozenset((
+    "TCI_CREATE_CTRL_LINK",
+    "TCI_CONFIGURE_LOGGING",
+    "TCI_QUERY_CAS",
+    "TCI_QUERY_LINK_STATS",
+    "TCI_QUERY_TUNNEL_INFO",
+))
+
+
+def encode(action, tag, params, framing=FRAMING_JSON):
+    """ Returns the wire bytes of the Tincan control message for the CBT action """
+    msg = ENCODERS[action](tag, params)
+    if framing == FRAMING_JSON:
+        return dumps(msg)
+    msg["IPOP"]["ProtocolVersion"] = BINARY_PROTOCOL_VERSION
+    return frame(msg)
+
+
+def frame(msg):
+    """ Returns the control message as a length-prefixed msgpack frame """
+    payload = msgpack.packb(msg, use_bin_type=True)
+    return _FRAME_HDR.pack(len(payload)) + payload
+
+
+def is_binary(data):
+    return data[:1] == b"\x00"
+
+
+def join(batch):
+    """ Returns the datagram carrying a batch of encoded control messages """
+    if len(batch) == 1:
+        return batch[0]
+    if is_binary(batch[0]):
+        # binary frames are self delimiting and are simply concatenated
+        return b"".join(batch)
+    return b"[" + b",".join(batch) + b"]"
+
+
+def decode(data):
+    """
+    Returns the Tincan control message in the datagram, or the list of messages when it
+    carries a batch.
+    """
+    if not is_binary(data):
+        return loads(data)
+    if msgpack is None:
+        raise ValueError("Binary framed Tincan message received but msgpack is unavailable")
+    msgs = []
+    view = memoryview(data)
+    pos = 0
+    while pos < len(data):
+        end = pos + _FRAME_HDR.size + _FRAME_HDR.unpack_from(data, pos)[0]
+        if end > len(data):
+            raise ValueError("Truncated Tincan control frame")
+        msgs.append(msgpack.unpackb(view[pos + _FRAME_HDR.size:end], raw=False))
+        pos = end
+    return msgs[0] if len(msgs) == 1 else msgs
@@ -29,6 +29,7 @@ from abc import ABCMeta, abstractmethod
 from distutils import spawn
 import controller.framework.ipoplib as ipoplib
 from controller.framework.ControllerModule import ControllerModule
+from controller.framework.ControllerModule import request_handler
 
 
 
@@ -293,15 +294,21 @@ class BridgeController(ControllerModule):
                                   "OverlayVisualizer module not loaded."
                                   " Visualization data will not be sent.")
 
-        self._cfx_handle.start_subscription("LinkManager", "LNK_TUNNEL_EVENTS")
+        # the bridge only acts on the connected and removed tunnel events
+        self._cfx_handle.start_subscription(
+            "LinkManager", "LNK_TUNNEL_EVENTS",
+            {"UpdateType": {"LnkEvConnected", "LnkEvRemoved"}})
         self.register_cbt("Logger", "LOG_INFO", "Module Loaded")
 
+    @request_handler("BRG_ADD_PORT")
     def req_handler_add_port(self, cbt):
         pass
 
+    @request_handler("BRG_DEL_PORT")
     def req_handler_del_port(self, cbt):
         pass
 
+    @request_handler("LNK_TUNNEL_EVENTS")
     def req_handler_manage_bridge(self, cbt):
         try:
             olid = cbt.request.params["OverlayId"]
@@ -334,27 +341,6 @@ class BridgeController(ControllerModule):
     def timer_method(self):
         pass
 
-    def process_cbt(self, cbt):
-        if cbt.op_type == "Request":
-            if cbt.request.action == "BRG_ADD_PORT":
-                self.req_handler_add_port(cbt)
-            elif cbt.request.action == "BRG_DEL_PORT":
-                self.req_handler_del_port(cbt)
-            elif cbt.request.action == "LNK_TUNNEL_EVENTS":
-                self.req_handler_manage_bridge(cbt)
-            elif cbt.request.action == "VIS_DATA_REQ":
-                self.req_handler_vis_data(cbt)
-            else:
-                self.req_handler_default(cbt)
-        elif cbt.op_type == "Response":
-            parent_cbt = cbt.parent
-            cbt_data = cbt.response.data
-            cbt_status = cbt.response.status
-            self.free_cbt(cbt)
-            if (parent_cbt is not None and parent_cbt.child_count == 1):
-                parent_cbt.set_response(cbt_data, cbt_status)
-                self.complete_cbt(parent_cbt)
-
     def terminate(self):
         try:
             for olid in self._ovl_net:
@@ -368,6 +354,7 @@ class BridgeController(ControllerModule):
         except RuntimeError as err:
             self.register_cbt("Logger", "LOG_WARNING", str(err))
 
+    @request_handler("VIS_DATA_REQ")
     def req_handler_vis_data(self, cbt):
         br_data = dict()
         is_data_available = False
@@ -20,10 +20,10 @@
 # THE SOFTWARE.
 
 import os
-import threading
 from collections import namedtuple
 import time
-from controller.framework.ControllerModule import ControllerModule
+from controller.framework.ControllerModule import ControllerModule, LazyArg
+from controller.framework.ControllerModule import request_handler, response_handler
 
 LinkEvent = ["LnkEvCreating", "LnkEvConnected", "LnkEvDisconnected", "LnkEvRemoved",
              "LnkEvAuthorized", "LnkEvDeauthorized"]
@@ -73,6 +73,7 @@ class Tunnel():
         self._tunnel_state = tnl_state
         self.creation_start_time = time.time()
         self.timeout = time.time() + state_timeout # timeout for current phase
+        self.deadline_timer = None # fires when the current phase times out
 
     def __repr__(self):
         state = "Tunnel<tnlid=%s, overlay_id=%s, peer_id=%s, tap_name=%s, mac=%s, link=%s, "\
@@ -104,7 +105,6 @@ class LinkManager(ControllerModule):
         self._tunnels = {}   # maps tunnel id to its descriptor
         self._peers = {}     # maps overlay id to peers map, which maps peer id to tunnel id
         self._links = {}     # maps link id to tunnel id
-        self._lock = threading.Lock()  # serializes access to _overlays, _links
         self._link_updates_publisher = None
         self._ignored_net_interfaces = dict()
 
@@ -114,7 +114,7 @@ class LinkManager(ControllerModule):
 
     def initialize(self):
         self._link_updates_publisher = \
-            self._cfx_handle.publish_subscription("LNK_TUNNEL_EVENTS")
+            self._cfx_handle.publish_subscription("LNK_TUNNEL_EVENTS", no_response=True)
         self._cfx_handle.start_subscription("TincanInterface",
                                             "TCI_TINCAN_MSG_NOTIFY")
         try:
@@ -160,6 +160,7 @@ class LinkManager(ControllerModule):
                        self._tunnels[tnlid].link.creation_state == 0xC0)
         return is_complete
 
+    @request_handler("LNK_ADD_IGN_INF")
     def req_handler_add_ign_inf(self, cbt):
         ign_inf_details = cbt.request.params
         for olid in ign_inf_details:
@@ -167,6 +168,7 @@ class LinkManager(ControllerModule):
         cbt.set_response(None, True)
         self.complete_cbt(cbt)
 
+    @request_handler("LNK_REMOVE_TUNNEL")
     def req_handler_remove_tnl(self, cbt):
         """Remove the tunnel and link given either the overlay id and peer id, or the tunnel id"""
         olid = cbt.request.params.get("OverlayId", None)
@@ -191,6 +193,7 @@ class LinkManager(ControllerModule):
             cbt.set_response("Tunnel busy, retry operation", False)
             self.complete_cbt(cbt)
 
+    @request_handler("LNK_REMOVE_LINK")
     def req_handler_remove_link(self, cbt):
         """Remove the link given either the overlay id and peer id, or the link id or tunnel id"""
         # not currently being used
@@ -227,7 +230,7 @@ class LinkManager(ControllerModule):
         self._tunnels[tnlid].mac = tnl_desc["MAC"]
         self._tunnels[tnlid].tap_name = tnl_desc["TapName"]
         self._tunnels[tnlid].fpr = tnl_desc["FPR"]
-        self.register_cbt("Logger", "LOG_DEBUG", "Updated tunnels:{}".format(self._tunnels[tnlid]))
+        self.log("LOG_DEBUG", "Updated tunnels:%s", LazyArg(str, self._tunnels[tnlid]))
 
     def _query_link_stats(self):
         """Query the status of links that have completed creation process"""
@@ -239,6 +242,7 @@ class LinkManager(ControllerModule):
         if params:
             self.register_cbt("TincanInterface", "TCI_QUERY_LINK_STATS", params)
 
+    @response_handler("TCI_QUERY_LINK_STATS")
     def resp_handler_query_link_stats(self, cbt):
         if not cbt.response.status:
             self.register_cbt("Logger", "LOG_WARNING", "Link stats update error: {0}"
@@ -292,6 +296,7 @@ class LinkManager(ControllerModule):
 
     def _cleanup_tunnel(self, tnl):
         """ Remove the tunnel data """
+        self._cfx_handle.cancel_timer(tnl.deadline_timer)
         del self._peers[tnl.overlay_id][tnl.peer_id]
         del self._tunnels[tnl.tnlid]
 
@@ -299,6 +304,7 @@ class LinkManager(ControllerModule):
         """ Remove the tunnel data """
         tnl = self._tunnels.pop(tnlid, None)
         if tnl:
+            self._cfx_handle.cancel_timer(tnl.deadline_timer)
             peer_id = tnl.peer_id
             olid = tnl.overlay_id
             del self._peers[olid][peer_id]
@@ -325,6 +331,7 @@ class LinkManager(ControllerModule):
             self._tunnels[tnlid].link = Link(lnkid, state)
         self._links[lnkid] = tnlid
 
+    @response_handler("TCI_REMOVE_TUNNEL")
     def resp_handler_remove_tunnel(self, rmv_tnl_cbt):
         """
         Clean up the tunnel meta data. Even of the CBT fails it is safe to discard
@@ -353,6 +360,7 @@ class LinkManager(ControllerModule):
                           .format(tnlid[:7], olid[:7], self.node_id[:7], peer_id[:7]))
         #self.register_cbt("Logger", "LOG_DEBUG", "State:\n" + str(self))
 
+    @response_handler("TCI_REMOVE_LINK")
     def resp_handler_remove_link(self, rmv_tnl_cbt):
         parent_cbt = rmv_tnl_cbt.parent
         tnlid = rmv_tnl_cbt.request.params["TunnelId"]
@@ -375,6 +383,7 @@ class LinkManager(ControllerModule):
                           .format(lnkid[:7], tnlid[:7], olid[:7], self.node_id[:7],
                                   peer_id[:7]))
 
+    @request_handler("LNK_QUERY_TUNNEL_INFO")
     def req_handler_query_tunnels_info(self, cbt):
         results = {}
         for tnlid in self._tunnels:
@@ -468,6 +477,7 @@ class LinkManager(ControllerModule):
                               "PeerId:{2}, LinkId:{0}, CreateState:{1}"
                               .format(tnlid[:7], format(creation_state, "02X"), peer_id[:7]))
 
+    @request_handler("LNK_AUTH_TUNNEL")
     def req_handler_auth_tunnel(self, cbt):
         """Node B"""
         olid = cbt.request.params["OverlayId"]
@@ -479,6 +489,7 @@ class LinkManager(ControllerModule):
         else:
             self._peers[olid][peer_id] = tnlid
             self._tunnels[tnlid] = Tunnel(tnlid, olid, peer_id)
+            self._arm_tunnel_deadline(self._tunnels[tnlid])
             self.register_cbt("Logger", "LOG_DEBUG", "TunnelId:{0} auth for Peer:{1} completed"
                               .format(tnlid[:7], peer_id[:7]))
             cbt.set_response("Auth completed, TunnelId:{0}".format(tnlid[:7]), True)
@@ -488,6 +499,9 @@ class LinkManager(ControllerModule):
             self._link_updates_publisher.post_update(lnkupd_param)
         self.complete_cbt(cbt)
 
+    # Create Link: Phase 1 Node A
+    # TOP wants a new link, first SIGnal peer to create endpt
+    @request_handler("LNK_CREATE_TUNNEL")
     def req_handler_create_tunnel(self, cbt):
         """
         Handle the request for capability LNK_CREATE_TUNNEL.
@@ -498,7 +512,6 @@ class LinkManager(ControllerModule):
         status can be queried to determine when it is writeable. The link id is
         communicated in the request and will be the same at both nodes.
         """
-        # Create Link: Phase 1 Node A
         olid = cbt.request.params["OverlayId"]
         peer_id = cbt.request.params["PeerId"]
         if peer_id in self._peers[olid]:
@@ -558,6 +571,7 @@ class LinkManager(ControllerModule):
         self._peers[olid][peer_id] = tnlid
         self._tunnels[tnlid] = Tunnel(tnlid, olid, peer_id, Tunnel.STATES.TNL_CREATING,
                                       self.config["LinkSetupTimeout"])
+        self._arm_tunnel_deadline(self._tunnels[tnlid])
         self._assign_link_to_tunnel(tnlid, lnkid, 0xA1)
 
         self.register_cbt("Logger", "LOG_DEBUG", "Create Link:{} Phase 1/5 Node A - Peer: {}"
@@ -570,8 +584,10 @@ class LinkManager(ControllerModule):
                   "Type": self.config["Overlays"][olid]["Type"], "PeerId": peer_id}
         self._create_tunnel(params, parent_cbt=cbt)
 
+    # Create Link: Phase 2 Node A
+    # Retrieved our node data for response
+    @response_handler("TCI_CREATE_TUNNEL")
     def resp_handler_create_tunnel(self, cbt):
-        # Create Link: Phase 2 Node A
         parent_cbt = cbt.parent
         lnkid = cbt.request.params["LinkId"]  # config overlay id
         tnlid = cbt.request.params["TunnelId"]
@@ -596,6 +612,9 @@ class LinkManager(ControllerModule):
         self._request_peer_endpoint(params, parent_cbt)
         self.free_cbt(cbt)
 
+    # Create Link: Phase 3 Node B
+    # Rcvd peer req to create endpt, send to TCI
+    @request_handler("LNK_REQ_LINK_ENDPT")
     def req_handler_req_link_endpt(self, lnk_endpt_cbt):
         params = lnk_endpt_cbt.request.params
         olid = params["OverlayId"]
@@ -625,6 +644,7 @@ class LinkManager(ControllerModule):
         lnkid = tnlid
         self._tunnels[tnlid].tunnel_state = Tunnel.STATES.TNL_CREATING
         self._tunnels[tnlid].timeout = time.time() + self.config["LinkSetupTimeout"]
+        self._arm_tunnel_deadline(self._tunnels[tnlid])
         self._assign_link_to_tunnel(tnlid, lnkid, 0xB1)
         # publish notification of link creation initiated Node B
         lnkupd_param = {
@@ -789,8 +809,10 @@ class LinkManager(ControllerModule):
         self.submit_cbt(lcbt)
         self.free_cbt(cbt)
 
+    # Create Link: Phase 7 Node B
+    # CAS rcvd from peer, sends to TCI to update link's peer CAS info
+    @request_handler("LNK_ADD_PEER_CAS")
     def req_handler_add_peer_cas(self, cbt):
-        # Create Link: Phase 7 Node B
         params = cbt.request.params
         olid = params["OverlayId"]
         lnkid = params["LinkId"]
@@ -811,6 +833,12 @@ class LinkManager(ControllerModule):
         lcbt.set_request(self.module_name, "TincanInterface", "TCI_CREATE_LINK", params)
         self.submit_cbt(lcbt)
 
+    # Create Link: Phase 4 Node B
+    # Create Link: Phase 6 Node A
+    # SIGnal to peer to update CAS
+    # Create Link: Phase 8 Node B
+    # Complete setup
+    @response_handler("TCI_CREATE_LINK")
     def resp_handler_create_link_endpt(self, cbt):
         parent_cbt = cbt.parent
         resp_data = cbt.response.data
@@ -866,6 +894,11 @@ class LinkManager(ControllerModule):
         self.register_cbt("Logger", "LOG_INFO", "Tunnel {0} created: {1}:{2}->{3}"
                           .format(lnkid[:7], olid[:7], self.node_id[:7], peer_id[:7]))
 
+    # Create Link: Phase 5 Node A
+    # Attempt to create our end of link
+    # Create Link: Phase 9 Node A
+    # Link created, notify others
+    @response_handler("SIG_REMOTE_ACTION")
     def resp_handler_remote_action(self, cbt):
         parent_cbt = cbt.parent
         resp_data = cbt.response.data
@@ -884,6 +917,7 @@ class LinkManager(ControllerModule):
             elif rem_act["Action"] == "LNK_ADD_PEER_CAS":
                 self._complete_create_link_request(parent_cbt)
 
+    @request_handler("TCI_TINCAN_MSG_NOTIFY")
     def req_handler_tincan_msg(self, cbt):
         lts = time.time()
         if cbt.request.params["Command"] == "LinkStateChange":
@@ -920,85 +954,6 @@ class LinkManager(ControllerModule):
             cbt.set_response(data=None, status=True)
         self.complete_cbt(cbt)
 
-    def process_cbt(self, cbt):
-        with self._lock:
-            if cbt.op_type == "Request":
-                if cbt.request.action == "LNK_CREATE_TUNNEL":
-                    # Create Link: Phase 1 Node A
-                    # TOP wants a new link, first SIGnal peer to create endpt
-                    self.req_handler_create_tunnel(cbt)
-
-                elif cbt.request.action == "LNK_REQ_LINK_ENDPT":
-                    # Create Link: Phase 3 Node B
-                    # Rcvd peer req to create endpt, send to TCI
-                    self.req_handler_req_link_endpt(cbt)
-
-                elif cbt.request.action == "LNK_ADD_PEER_CAS":
-                    # Create Link: Phase 7 Node B
-                    # CAS rcvd from peer, sends to TCI to update link's peer CAS info
-                    self.req_handler_add_peer_cas(cbt)
-
-                elif cbt.request.action == "LNK_REMOVE_TUNNEL":
-                    self.req_handler_remove_tnl(cbt)
-
-                elif cbt.request.action == "LNK_REMOVE_LINK":
-                    self.req_handler_remove_link(cbt)
-
-                elif cbt.request.action == "LNK_QUERY_TUNNEL_INFO":
-                    self.req_handler_query_tunnels_info(cbt)
-
-                elif cbt.request.action == "VIS_DATA_REQ":
-                    self.req_handler_query_viz_data(cbt)
-
-                elif cbt.request.action == "TCI_TINCAN_MSG_NOTIFY":
-                    self.req_handler_tincan_msg(cbt)
-
-                elif cbt.request.action == "LNK_ADD_IGN_INF":
-                    self.req_handler_add_ign_inf(cbt)
-
-                elif cbt.request.action == "LNK_AUTH_TUNNEL":
-                    self.req_handler_auth_tunnel(cbt)
-                else:
-                    self.req_handler_default(cbt)
-            elif cbt.op_type == "Response":
-                if cbt.request.action == "SIG_REMOTE_ACTION":
-                    # Create Link: Phase 5 Node A
-                    # Attempt to create our end of link
-                    # Create Link: Phase 9 Node A
-                    # Link created, notify others
-                    self.resp_handler_remote_action(cbt)
-
-                elif cbt.request.action == "TCI_CREATE_LINK":
-                    # Create Link: Phase 4 Node B
-                    # Create Link: Phase 6 Node A
-                    # SIGnal to peer to update CAS
-                    # Create Link: Phase 8 Node B
-                    # Complete setup
-                    self.resp_handler_create_link_endpt(cbt)
-
-                elif cbt.request.action == "TCI_CREATE_TUNNEL":
-                    # Create Link: Phase 2 Node A
-                    # Retrieved our node data for response
-                    self.resp_handler_create_tunnel(cbt)
-
-                elif cbt.request.action == "TCI_QUERY_LINK_STATS":
-                    self.resp_handler_query_link_stats(cbt)
-
-                elif cbt.request.action == "TCI_REMOVE_LINK":
-                    self.resp_handler_remove_link(cbt)
-
-                elif cbt.request.action == "TCI_REMOVE_TUNNEL":
-                    self.resp_handler_remove_tunnel(cbt)
-
-                else:
-                    parent_cbt = cbt.parent
-                    cbt_data = cbt.response.data
-                    cbt_status = cbt.response.status
-                    self.free_cbt(cbt)
-                    if (parent_cbt is not None and parent_cbt.child_count == 1):
-                        parent_cbt.set_response(cbt_data, cbt_status)
-                        self.complete_cbt(parent_cbt)
-
     def _deauth_tnl(self, tnl):
         self.register_cbt("Logger", "LOG_INFO", "Tunnel {0} auth timed out".format(tnl.tnlid))
         param = {
@@ -1007,29 +962,35 @@ class LinkManager(ControllerModule):
         self._link_updates_publisher.post_update(param)
         self._cleanup_tunnel(tnl)
 
-    def _cleanup_expired_incomplete_links(self):
-        deauth = []
-        rollbk = []
-        for tnlid, tnl in self._tunnels.items():
-            if tnl.tunnel_state == Tunnel.STATES.TNL_AUTHORIZED and time.time() > tnl.timeout:
-                deauth.append(tnl)
-            elif  tnl.link is not None and tnl.link.creation_state != 0xC0 and \
-                time.time() > tnl.timeout:
-                rollbk.append(tnlid)
-        for tnl in deauth:
+    def _arm_tunnel_deadline(self, tnl):
+        """ Schedule a check of the tunnel for when its current phase times out """
+        self._cfx_handle.cancel_timer(tnl.deadline_timer)
+        tnl.deadline_timer = self._cfx_handle.start_timer(max(tnl.timeout - time.time(), 0),
+                                                          self._tunnel_deadline_expired, tnl)
+
+    def _tunnel_deadline_expired(self, tnl):
+        if self._tunnels.get(tnl.tnlid) is not tnl:
+            return
+        tnl.deadline_timer = None
+        if time.time() < tnl.timeout:
+            # the phase deadline was extended since the timer was armed
+            self._arm_tunnel_deadline(tnl)
+        elif tnl.tunnel_state == Tunnel.STATES.TNL_AUTHORIZED:
             self._deauth_tnl(tnl)
-        for tnlid in rollbk:
-            self._rollback_link_creation_changes(tnlid)
+        elif tnl.link is not None and tnl.link.creation_state != 0xC0:
+            self._rollback_link_creation_changes(tnl.tnlid)
+            # recheck until the tunnel removal completes
+            tnl.deadline_timer = self._cfx_handle.start_timer(
+                self.config.get("TimerInterval", 30), self._tunnel_deadline_expired, tnl)
 
     def timer_method(self):
-        with self._lock:
-            self._cleanup_expired_incomplete_links()
-            self._query_link_stats()
-            self.log("LOG_DEBUG", "Timer LNK State=%s", str(self))
+        self._query_link_stats()
+        self.log("LOG_DEBUG", "Timer LNK State=%s", LazyArg(str, self))
 
     def terminate(self):
         pass
 
+    @request_handler("VIS_DATA_REQ")
     def req_handler_query_viz_data(self, cbt):
         nid = self.node_id
         tnls = dict()
@@ -19,16 +19,88 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import copy
 import logging
 import logging.handlers as lh
 import os
+import queue
+try:
+    from queue import SimpleQueue as LogQueue
+except ImportError:
+    from queue import Queue as LogQueue
 from controller.framework.ControllerModule import ControllerModule
+from controller.framework.ControllerModule import request_handler
+
+
+class LogQueueHandler(lh.QueueHandler):
+    """
+    Enqueues log records from the caller's thread. The message is merged with its arguments
+    here, while the module state they refer to is consistent, and the rest of the formatting
+    is done by the listener thread.
+    """
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class BatchedRotatingFileHandler(lh.RotatingFileHandler):
+    """
+    Rotating file handler that leaves the flushing of its stream to commit() so that a burst
+    of records is written out together.
+    """
+    def flush(self):
+        pass
+
+    def commit(self):
+        super(BatchedRotatingFileHandler, self).flush()
+
+    def close(self):
+        self.commit()
+        super(BatchedRotatingFileHandler, self).close()
+
+
+class BatchingQueueListener(lh.QueueListener):
+    """
+    Commits the batched handlers whenever the log queue is drained, before blocking for the
+    next record.
+    """
+    def dequeue(self, block):
+        try:
+            return self.queue.get(block=False)
+        except queue.Empty:
+            if not block:
+                raise
+        self.commit()
+        return self.queue.get(block=True)
+
+    def commit(self):
+        for handler in self.handlers:
+            commit = getattr(handler, "commit", None)
+            if commit is not None:
+                commit()
 
 
 class Logger(ControllerModule):
     def __init__(self, cfx_handle, module_config, module_name):
         super(Logger, self).__init__(cfx_handle, module_config, module_name)
-        self._logger = None
+        self._listener = None
+        self._queue_handler = None
+
+    def _create_file_handler(self, formatter, **kwargs):
+        # Extracts the filepath else sets logs to current working directory
+        filepath = self._cm_config.get("Directory", "./")
+        fqname = filepath + \
+            self._cm_config.get("CtrlLogFileName", "ctrl.log")
+        if not os.path.exists(filepath):
+            os.makedirs(filepath, exist_ok=True)
+        if os.path.isfile(fqname):
+            os.remove(fqname)
+        # Creates rotating filehandler
+        handler = BatchedRotatingFileHandler(filename=fqname, **kwargs)
+        handler.setFormatter(formatter)
+        return handler
 
     def initialize(self):
         # Extracts the controller Log Level from the ipop-config file,
@@ -36,104 +108,88 @@ class Logger(ControllerModule):
         level = logging.INFO
         if "LogLevel" in self._cm_config:
             level = getattr(logging, self._cm_config["LogLevel"])
+        console_formatter = logging.Formatter(
+            "[%(asctime)s.%(msecs)03d] %(levelname)s: %(message)s", datefmt="%H:%M:%S")
+        file_formatter = logging.Formatter(
+            "[%(asctime)s.%(msecs)03d] %(levelname)s:%(message)s", datefmt="%Y%m%d %H:%M:%S")
+        handlers = []
 
         # If the Logging is set to Console by the User
         if self._cm_config["Device"] == "Console":
-            # Console logging
+            # Console logging, the root logger is configured for the benefit of 3rd party libs
             logging.basicConfig(format="[%(asctime)s.%(msecs)03d] %(levelname)s: %(message)s",
                                 datefmt="%H:%M:%S",
                                 level=level)
-            self._logger = logging.getLogger("IPOP console logger")
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(console_formatter)
+            handlers.append(console_handler)
 
         # If the Logging is set to File by the User
         elif self._cm_config["Device"] == "File":
-            # Extracts the filepath else sets logs to current working directory
-            filepath = self._cm_config.get("Directory", "./")
-            fqname = filepath + \
-                self._cm_config.get("CtrlLogFileName", "ctrl.log")
-            if not os.path.exists(filepath):
-                os.makedirs(filepath, exist_ok=True)
-            if os.path.isfile(fqname):
-                os.remove(fqname)
-            self._logger = logging.getLogger("IPOP Rotating Log")
-            self._logger.setLevel(level)
-            # Creates rotating filehandler
-            handler = lh.RotatingFileHandler(filename=fqname,
-                                             maxBytes=self._cm_config["MaxFileSize"],
-                                             backupCount=self._cm_config["MaxArchives"])
-            formatter = logging.Formatter(
-                "[%(asctime)s.%(msecs)03d] %(levelname)s:%(message)s", datefmt="%Y%m%d %H:%M:%S")
-            handler.setFormatter(formatter)
-            # Adds the filehandler to the Python logger module
-            self._logger.addHandler(handler)
+            handlers.append(self._create_file_handler(
+                file_formatter, maxBytes=self._cm_config["MaxFileSize"],
+                backupCount=self._cm_config["MaxArchives"]))
 
          # If the Logging is set to All by the User
         else:
-            self._logger = logging.getLogger("IPOP Console & File Logger")
-            self._logger.setLevel(level)
-
             #Console Logger
             console_handler = logging.StreamHandler()
-            console_log_formatter = logging.Formatter(
-                "[%(asctime)s.%(msecs)03d] %(levelname)s: %(message)s",
-                datefmt="%H:%M:%S")
-            console_handler.setFormatter(console_log_formatter)
-            self._logger.addHandler(console_handler)
-
-            # Extracts the filepath else sets logs to current working directory
-            filepath = self._cm_config.get("Directory", "./")
-            fqname = filepath + \
-                self._cm_config.get("CtrlLogFileName", "ctrl.log")
-            if not os.path.exists(filepath):
-                os.makedirs(filepath, exist_ok=True)
-            if os.path.isfile(fqname):
-                os.remove(fqname)
-
+            console_handler.setFormatter(console_formatter)
+            handlers.append(console_handler)
             #File Logger
-            # Creates rotating filehandler
-            file_handler = lh.RotatingFileHandler(filename=fqname)
-            file_log_formatter = logging.Formatter(
-                "[%(asctime)s.%(msecs)03d] %(levelname)s:%(message)s", datefmt="%Y%m%d %H:%M:%S")
-            file_handler.setFormatter(file_log_formatter)
-            self._logger.addHandler(file_handler)
+            handlers.append(self._create_file_handler(file_formatter))
+
+        # Records are filtered by level on the caller's thread and handed off through the
+        # queue, formatting and file I/O happen on the listener's thread
+        log_queue = LogQueue()
+        self._listener = BatchingQueueListener(log_queue, *handlers)
+        self._listener.start()
+        self._logger.setLevel(level)
+        self._logger.propagate = False
+        self._queue_handler = LogQueueHandler(log_queue)
+        self._logger.addHandler(self._queue_handler)
 
         self._logger.info("Logger: Module loaded")
 
-    def process_cbt(self, cbt):
-        if cbt.op_type == "Request":
-            lvl = cbt.request.action
-            mod = cbt.request.initiator
-            if isinstance(cbt.request.params, tuple):
-                fmt = "%s: "+ cbt.request.params[0]
-                vals = cbt.request.params[1]
-            else:
-                fmt = "%s: %s"
-                vals = [cbt.request.params]
-
-            if lvl == "LOG_DEBUG":
-                self._logger.debug(fmt, mod, *vals)
-                cbt.set_response(None, True)
-            elif lvl == "LOG_INFO":
-                self._logger.info(fmt, mod, *vals)
-                cbt.set_response(None, True)
-            elif lvl == "LOG_WARNING":
-                self._logger.warning(fmt, mod, *vals)
-                cbt.set_response(None, True)
-            elif lvl == "LOG_ERROR":
-                self._logger.error(fmt, mod, *vals)
-                cbt.set_response(None, True)
-            elif lvl == "LOG_QUERY_CONFIG":
-                cbt.set_response(self._cm_config, True)
-            else:
-                self._logger.warning("%s: Unsupported CBT action %s", self._module_name, str(cbt))
-                cbt.set_response("Unsupported CBT action", False)
-            self.complete_cbt(cbt)
-
-        elif cbt.op_type == "Response":
-            self.free_cbt(cbt)
+    @request_handler("LOG_DEBUG", "LOG_INFO", "LOG_WARNING", "LOG_ERROR")
+    def req_handler_log(self, cbt):
+        lvl = cbt.request.action
+        mod = cbt.request.initiator
+        if isinstance(cbt.request.params, tuple):
+            fmt = "%s: "+ cbt.request.params[0]
+            vals = cbt.request.params[1]
+        else:
+            fmt = "%s: %s"
+            vals = [cbt.request.params]
+
+        if lvl == "LOG_DEBUG":
+            self._logger.debug(fmt, mod, *vals)
+        elif lvl == "LOG_INFO":
+            self._logger.info(fmt, mod, *vals)
+        elif lvl == "LOG_WARNING":
+            self._logger.warning(fmt, mod, *vals)
+        else:
+            self._logger.error(fmt, mod, *vals)
+        cbt.set_response(None, True)
+        self.complete_cbt(cbt)
+
+    @request_handler("LOG_QUERY_CONFIG")
+    def req_handler_query_config(self, cbt):
+        cbt.set_response(self._cm_config, True)
+        self.complete_cbt(cbt)
+
+    def req_handler_default(self, cbt):
+        self._logger.warning("%s: Unsupported CBT action %s", self._module_name, str(cbt))
+        cbt.set_response("Unsupported CBT action", False)
+        self.complete_cbt(cbt)
 
     def timer_method(self):
         pass
 
     def terminate(self):
+        # detached first, records logged after this would sit in a queue nothing drains
+        if self._queue_handler is not None:
+            self._logger.removeHandler(self._queue_handler)
+        if self._listener is not None:
+            self._listener.stop()
         logging.shutdown()
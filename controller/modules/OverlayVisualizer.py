@@ -23,10 +23,10 @@ try:
     import simplejson as json
 except ImportError:
     import json
-import threading
 from collections import defaultdict
 import requests
 from controller.framework.ControllerModule import ControllerModule
+from controller.framework.ControllerModule import response_handler
 
 
 class OverlayVisualizer(ControllerModule):
@@ -40,8 +40,6 @@ class OverlayVisualizer(ControllerModule):
 
         # The visualizer dataset which is forwarded to the collector service
         self._vis_ds = dict(NodeId=self.node_id, VizData=defaultdict(dict))
-        # Its lock
-        self._vis_ds_lock = threading.Lock()
 
     def initialize(self):
         # We're using the pub-sub model here to gather data for the visualizer
@@ -54,39 +52,25 @@ class OverlayVisualizer(ControllerModule):
 
         self.register_cbt("Logger", "LOG_INFO", "Module loaded")
 
-    def process_cbt(self, cbt):
-        if cbt.op_type == "Response":
-            if cbt.request.action == "VIS_DATA_REQ":
-                msg = cbt.response.data
-
-                if cbt.response.status and msg:
-                    with self._vis_ds_lock:
-                        for mod_name in msg:
-                            for ovrl_id in msg[mod_name]:
-                                self._vis_ds["VizData"][ovrl_id][mod_name] = msg[mod_name][ovrl_id]
-                else:
-                    warn_msg = "Got no data in CBT response from module" \
-                        " {}".format(cbt.request.recipient)
-                    self.register_cbt("Logger", "LOG_WARNING", warn_msg)
-                self.free_cbt(cbt)
-            else:
-                parent_cbt = cbt.parent
-                cbt_data = cbt.response.data
-                cbt_status = cbt.response.status
-                self.free_cbt(cbt)
-                if (parent_cbt is not None and parent_cbt.child_count == 1):
-                    parent_cbt.set_response(cbt_data, cbt_status)
-                    self.complete_cbt(parent_cbt)
+    @response_handler("VIS_DATA_REQ")
+    def resp_handler_vis_data(self, cbt):
+        msg = cbt.response.data
 
+        if cbt.response.status and msg:
+            for mod_name in msg:
+                for ovrl_id in msg[mod_name]:
+                    self._vis_ds["VizData"][ovrl_id][mod_name] = msg[mod_name][ovrl_id]
         else:
-            self.req_handler_default(cbt)
+            warn_msg = "Got no data in CBT response from module" \
+                " {}".format(cbt.request.recipient)
+            self.register_cbt("Logger", "LOG_WARNING", warn_msg)
+        self.free_cbt(cbt)
 
     def timer_method(self):
-        with self._vis_ds_lock:
-            vis_ds = self._vis_ds
-            # flush old data, next itr provides new data
-            self._vis_ds = dict(NodeId=self.node_id,
-                                VizData=defaultdict(dict))
+        vis_ds = self._vis_ds
+        # flush old data, next itr provides new data
+        self._vis_ds = dict(NodeId=self.node_id,
+                            VizData=defaultdict(dict))
         if "NodeName" in self._cm_config:
             vis_ds["NodeName"] = self._cm_config["NodeName"]
         if "GeoCoordinate" in self._cm_config:
@@ -35,6 +35,7 @@ from sleekxmpp.xmlstream.handler.callback import Callback
 from sleekxmpp.xmlstream.matcher import StanzaPath
 from sleekxmpp.stanza.message import Message
 from controller.framework.ControllerModule import ControllerModule
+from controller.framework.ControllerModule import request_handler
 
 
 class IpopSignal(ElementBase):
@@ -282,7 +283,6 @@ class Signal(ControllerModule):
         self._presence_publisher = None
         self._circles = {}
         self._remote_acts = {}
-        self._lock = threading.Lock()
         self.request_timeout = self._cfx_handle.query_param("RequestTimeout")
         self._scavenge_timer = time.time()
 
@@ -293,7 +293,8 @@ class Signal(ControllerModule):
         return xport
 
     def initialize(self):
-        self._presence_publisher = self._cfx_handle.publish_subscription("SIG_PEER_PRESENCE_NOTIFY")
+        self._presence_publisher = self._cfx_handle.publish_subscription(
+            "SIG_PEER_PRESENCE_NOTIFY", no_response=True)
         for overlay_id in self.overlays:
             overlay_descr = self.overlays[overlay_id]
             self._circles[overlay_id] = {}
@@ -308,6 +309,7 @@ class Signal(ControllerModule):
                                                 self._circles[overlay_id]["OutgoingRemoteActs"])
         self.sig_log("Module loaded", "LOG_INFO")
 
+    @request_handler("SIG_QUERY_REPORTING_DATA")
     def req_handler_query_reporting_data(self, cbt):
         rpt = {}
         for overlay_id in self.overlays:
@@ -353,11 +355,12 @@ class Signal(ControllerModule):
             return
         tag = rem_act["ActionTag"]
         cbt_status = rem_act["Status"]
-        pending_cbt = self._cfx_handle._pending_cbts.get(tag, None)
+        pending_cbt = self._cfx_handle.pop_pending_cbt(tag)
         if pending_cbt:
             pending_cbt.set_response(data=rem_act, status=cbt_status)
             self.complete_cbt(pending_cbt)
 
+    @request_handler("SIG_REMOTE_ACTION")
     def req_handler_initiate_remote_action(self, cbt):
         """
         Create a new remote action from the received CBT and transmit it to the recepient
@@ -415,39 +418,24 @@ class Signal(ControllerModule):
                          .format(peer_id, payload))
 
     def process_cbt(self, cbt):
-        with self._lock:
-            if cbt.op_type == "Request":
-                if cbt.request.action == "SIG_REMOTE_ACTION":
-                    self.req_handler_initiate_remote_action(cbt)
-                elif cbt.request.action == "SIG_QUERY_REPORTING_DATA":
-                    self.req_handler_query_reporting_data(cbt)
-                else:
-                    self.req_handler_default(cbt)
-            elif cbt.op_type == "Response":
-                if cbt.tag in self._remote_acts:
-                    self.resp_handler_remote_action(cbt)
-                else:
-                    parent_cbt = cbt.parent
-                    cbt_data = cbt.response.data
-                    cbt_status = cbt.response.status
-                    self.free_cbt(cbt)
-                    if (parent_cbt is not None and parent_cbt.child_count == 1):
-                        parent_cbt.set_response(cbt_data, cbt_status)
-                        self.complete_cbt(parent_cbt)
+        # responses to remote actions are matched by tag since they carry the remote action
+        if cbt.op_type == "Response" and cbt.tag in self._remote_acts:
+            self.resp_handler_remote_action(cbt)
+        else:
+            super(Signal, self).process_cbt(cbt)
 
     def timer_method(self):
-        with self._lock:
-            for overlay_id in self._circles:
-                anc = self._circles[overlay_id]["Announce"]
-                if time.time() >= anc:
-                    self._circles[overlay_id]["Transport"].send_presence(pstatus="ident#" +
-                                                                         self.node_id)
-                    self._circles[overlay_id]["Announce"] = time.time() + \
-                        (int(self.config["PresenceInterval"]) * random.randint(2, 20))
-                self._circles[overlay_id]["JidCache"].scavenge()
-                self.scavenge_expired_outgoing_rem_acts(self._circles[overlay_id]
-                                                        ["OutgoingRemoteActs"])
-            self.scavenge_pending_cbts()
+        for overlay_id in self._circles:
+            anc = self._circles[overlay_id]["Announce"]
+            if time.time() >= anc:
+                self._circles[overlay_id]["Transport"].send_presence(pstatus="ident#" +
+                                                                     self.node_id)
+                self._circles[overlay_id]["Announce"] = time.time() + \
+                    (int(self.config["PresenceInterval"]) * random.randint(2, 20))
+            self._circles[overlay_id]["JidCache"].scavenge()
+            self.scavenge_expired_outgoing_rem_acts(self._circles[overlay_id]
+                                                    ["OutgoingRemoteActs"])
+        self.scavenge_pending_cbts()
 
     def terminate(self):
         for overlay_id in self._circles:
@@ -457,15 +445,7 @@ class Signal(ControllerModule):
         self.register_cbt("Logger", level, msg)
 
     def scavenge_pending_cbts(self):
-        scavenge_list = []
-        for item in self._cfx_handle._pending_cbts.items():
-            if time.time() - item[1].time_submit >= self.request_timeout:
-                scavenge_list.append(item[0])
-        for tag in scavenge_list:
-            pending_cbt = self._cfx_handle._pending_cbts.pop(tag, None)
-            if pending_cbt:
-                pending_cbt.set_response("The request has expired", False)
-                self.complete_cbt(pending_cbt)
+        self._cfx_handle.expire_pending_cbts("The request has expired")
 
     def scavenge_expired_outgoing_rem_acts(self, outgoing_rem_acts):
         # clear out the JID Refresh queue for a peer if the oldest entry age exceeds the limit
@@ -485,7 +465,7 @@ class Signal(ControllerModule):
                 entry = rem_act_que.get()
                 if entry[0] == "invk":
                     tag = entry[1]["ActionTag"]
-                    pending_cbt = self._cfx_handle._pending_cbts.get(tag, None)
+                    pending_cbt = self._cfx_handle.pop_pending_cbt(tag)
                     if pending_cbt:
                         pending_cbt.set_response("The specified recipient was not found", False)
                         self.complete_cbt(pending_cbt)
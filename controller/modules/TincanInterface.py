@@ -19,233 +19,634 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-import socket
-import select
+import asyncio
+import itertools
+import os
+import queue
 try:
-    import simplejson as json
+    from queue import SimpleQueue as DecodeQueue
 except ImportError:
-    import json
-from threading import Thread
+    from queue import Queue as DecodeQueue
+import selectors
+import socket
+import stat
+import time
+from threading import Lock, Thread
 import traceback
 from distutils import spawn
 import controller.framework.ipoplib as ipoplib
+import controller.framework.tincanlib as tincanlib
+from controller.framework.CFxMetrics import Histogram
+from controller.framework.CFxTimer import DeadlineTable
 from controller.framework.ControllerModule import ControllerModule
+from controller.framework.ControllerModule import request_handler, response_handler
+
+
+class TincanDatagramProtocol(asyncio.DatagramProtocol):
+    """Receives Tincan control datagrams when CFx runs the asyncio engine"""
+    def __init__(self, tci):
+        self._tci = tci
+
+    def datagram_received(self, data, addr):
+        try:
+            self._tci._process_tincan_datagram(data)
+        except Exception as err:
+            self._tci.log("LOG_WARNING", "Tincan datagram exception:%s\n%s", err,
+                          traceback.format_exc())
+
+    def error_received(self, exc):
+        self._tci.log("LOG_WARNING", "Tincan listener socket error:%s", exc)
+
+
+class InFlightRequest():
+    """A control request sent to Tincan that is awaiting its response"""
+    __slots__ = ("cbt", "msg", "time_sent", "retransmits", "max_retransmits")
+
+    def __init__(self, cbt, msg, time_sent, max_retransmits):
+        self.cbt = cbt
+        self.msg = msg
+        self.time_sent = time_sent
+        self.retransmits = 0
+        self.max_retransmits = max_retransmits
 
 
 class TincanInterface(ControllerModule):
     def __init__(self, cfx_handle, module_config, module_name):
         super(TincanInterface, self).__init__(cfx_handle, module_config, module_name)
         self._tincan_listener_thread = None    # UDP listener thread object
+        self._tincan_decoder_threads = []
+        # raw datagrams from the listener awaiting decode, responses are kept apart from
+        # notifications so that a burst of notifications does not hold up pending requests
+        self._response_queue = DecodeQueue()
+        self._notify_queue = DecodeQueue()
         self._tci_publisher = None
+        # control messages sent within the batch window share a datagram, when enabled
+        self._batch_window = self._cm_config.get("BatchWindow", 0)
+        self._max_batch_size = self._cm_config.get("MaxBatchSize", 32)
+        self._max_batch_bytes = self._cm_config.get("MaxBatchBytes", 16384)
+        self._send_queue = None
+        self._tincan_sender_thread = None
+        # control messages are JSON until Tincan accepts the configured framing
+        self._framing = tincanlib.FRAMING_JSON
+        # requests sent to Tincan awaiting a response, keyed by TransactionId, in the order
+        # they are next due to be retransmitted or failed
+        self._inflight = DeadlineTable()
+        self._inflight_lck = Lock()
+        self._inflight_timer = None
+        self._retransmit_timeout = self._cm_config.get("RetransmitTimeout", 5)
+        self._max_retransmits = self._cm_config.get("MaxRetransmits", 2)
+        # a request that is not retransmitted is given the time it would have had over all
+        # of its retransmissions
+        self._request_expiry = self._retransmit_timeout * (2 ** (self._max_retransmits + 1) - 1)
+        self._max_inflight = self._cm_config.get("MaxInFlight", 1024)
+        self._inflight_stats = {"Sent": 0, "Retransmitted": 0, "TimedOut": 0, "Rejected": 0,
+                                "LateResponses": 0, "MaxOutstanding": 0}
+        self._response_time = Histogram()
 
+        self._transport = self._cm_config.get("Transport", "udp")
+        self._sock_type = socket.SOCK_DGRAM
+        self._socket_dir_shared = None
+        if self._transport == "unix":
+            self._init_unix_transport()
+        else:
+            self._init_udp_transport()
+        self.iptool = spawn.find_executable("ip")
+
+    def _init_udp_transport(self):
+        self._max_read_size = self._cm_config["MaxReadSize"]
         self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self._sock_svr = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if self._cm_config.get("RcvBufferSize"):
+            # room for a burst of Tincan messages while the listener is descheduled
+            self._sock_svr.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                                      self._cm_config["RcvBufferSize"])
         # Controller UDP listening socket
         self._sock_svr.bind((self._cm_config["RcvServiceAddress"],
                              self._cm_config["CtrlRecvPort"]))
         # Controller UDP sending socket
         self._dest = (self._cm_config["SndServiceAddress"], self._cm_config["CtrlSendPort"])
         self._sock.bind(("", 0))
-        self._sock_list = [self._sock_svr]
-        self.iptool = spawn.find_executable("ip")
+
+    def _init_unix_transport(self):
+        # Unix domain sockets skip the loopback IP stack and are not bound by the size of a
+        # UDP datagram, so large responses such as link stats fit in one message
+        self._max_read_size = self._cm_config.get("UnixMaxReadSize", 1048576)
+        if self._cm_config.get("SocketType", "dgram") == "seqpacket":
+            # a single connection to Tincan's control socket carries both directions, it is
+            # made once the module is running and remade whenever Tincan restarts
+            self._sock_type = socket.SOCK_SEQPACKET
+            self._sock = None
+            self._sock_svr = None
+            self._dest = None
+            self._connect_retry_interval = self._cm_config.get("ConnectRetryInterval", 1)
+            self._connect_failures = 0
+            return
+        else:
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._sock_svr = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            path = self._cm_config["CtrlRecvPath"]
+            self._prepare_socket_path(path)
+            try:
+                self._sock_svr.bind(path)
+            except OSError as err:
+                raise RuntimeError("Failed to bind the Tincan control socket {0}: {1}"
+                                   .format(path, err))
+            self._dest = self._cm_config["CtrlSendPath"]
+        if self._cm_config.get("RcvBufferSize"):
+            self._sock_svr.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                                      self._cm_config["RcvBufferSize"])
+
+    def _prepare_socket_path(self, path):
+        """
+        Readies the path of the controller's unix socket, creating its directory private to
+        this user and removing a socket of ours left behind by a previous run. Anything else
+        at the path is reported rather than removed.
+        """
+        dirname = os.path.dirname(path) or "."
+        try:
+            os.makedirs(dirname, mode=0o700, exist_ok=True)
+            if not os.access(dirname, os.W_OK | os.X_OK):
+                raise PermissionError("directory is not writable")
+            if os.stat(dirname).st_mode & stat.S_IWOTH:
+                # reported once the Logger is running
+                self._socket_dir_shared = dirname
+            st = os.lstat(path)
+        except FileNotFoundError:
+            return
+        except OSError as err:
+            raise RuntimeError("The Tincan control socket directory {0} is not usable: {1}. "
+                               "Set CtrlRecvPath to a path in a directory this user owns"
+                               .format(dirname, err))
+        if not stat.S_ISSOCK(st.st_mode) or st.st_uid != os.getuid():
+            raise RuntimeError("{0} exists and is not a socket owned by this user, remove it "
+                               "or set CtrlRecvPath".format(path))
+        try:
+            os.unlink(path)
+        except OSError as err:
+            raise RuntimeError("Failed to remove the stale Tincan control socket {0}: {1}"
+                               .format(path, err))
 
     def initialize(self):
-        self._tincan_listener_thread = Thread(target=self.__tincan_listener)
-        self._tincan_listener_thread.setDaemon(True)
-        self._tincan_listener_thread.start()
+        if self._socket_dir_shared is not None:
+            self.log("LOG_WARNING", "The Tincan control socket directory %s is writable by "
+                     "other users", self._socket_dir_shared)
+        if self._batch_window > 0:
+            self._send_queue = queue.Queue()
+            self._tincan_sender_thread = Thread(target=self.__tincan_sender,
+                                                name="TincanInterface::__sender", daemon=True)
+            self._tincan_sender_thread.start()
+        if self._retransmit_timeout > 0:
+            # at a fraction of the timeout, so a request is resent no more than a quarter late
+            self._inflight_timer = self._cfx_handle.start_timer(
+                self._retransmit_timeout / 4, self._expire_inflight_requests, periodic=True)
+        loop = self._cfx_handle.event_loop
+        if loop is None:
+            # responses are decoded apart from notifications, which keep to a single thread to
+            # preserve the order Tincan sent them in. A pool of response decoders, for throughput,
+            # may complete responses out of order, e.g., an older QueryLinkStats after a newer one
+            for i in range(max(int(self._cm_config.get("DecoderPoolSize", 1)), 1)):
+                self._tincan_decoder_threads.append(
+                    Thread(target=self.__tincan_decoder, args=(self._response_queue,),
+                           name="TincanInterface::__decoder{0}".format(i), daemon=True))
+            self._tincan_decoder_threads.append(
+                Thread(target=self.__tincan_decoder, args=(self._notify_queue,),
+                       name="TincanInterface::__notifier", daemon=True))
+            for thread in self._tincan_decoder_threads:
+                thread.start()
+            self._tincan_listener_thread = Thread(target=self.__tincan_listener,
+                                                  name="TincanInterface::__listener",
+                                                  daemon=True)
+            self._tincan_listener_thread.start()
+        elif self._sock_type == socket.SOCK_SEQPACKET:
+            loop.call_soon_threadsafe(self._connect_control_async)
+        else:
+            # the asyncio engine delivers Tincan datagrams on the event loop
+            transport, _ = asyncio.run_coroutine_threadsafe(
+                loop.create_datagram_endpoint(lambda: TincanDatagramProtocol(self),
+                                              sock=self._sock_svr), loop).result()
+            # the selector transport reads at most 256KB per datagram by default
+            transport.max_size = max(self._max_read_size, transport.max_size)
+        self._tci_publisher = self._cfx_handle.publish_subscription("TCI_TINCAN_MSG_NOTIFY",
+                                                                   no_response=True)
+        if self._sock_type != socket.SOCK_SEQPACKET:
+            # on the seqpacket transport Tincan is set up each time the connection is made
+            self.create_control_link()
+            self.register_cbt("Logger", "LOG_QUERY_CONFIG")
+        self.log("LOG_INFO", "Module loaded")
+
+    def _open_control_connection(self):
+        """
+        Connects to Tincan's seqpacket control socket and creates the control link over it.
+        Returns False, to be retried, while Tincan is not listening.
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        try:
+            sock.connect(self._cm_config["CtrlSendPath"])
+        except OSError as err:
+            sock.close()
+            if self._connect_failures == 0:
+                self.log("LOG_WARNING", "Waiting for Tincan at %s: %s",
+                         self._cm_config["CtrlSendPath"], err)
+            self._connect_failures += 1
+            return False
+        if self._cm_config.get("RcvBufferSize"):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                            self._cm_config["RcvBufferSize"])
+        self._connect_failures = 0
+        self._sock = self._sock_svr = sock
+        # a new Tincan process starts out on JSON
+        self._framing = tincanlib.FRAMING_JSON
+        self.log("LOG_INFO", "Connected to Tincan at %s", self._cm_config["CtrlSendPath"])
         self.create_control_link()
-        self._tci_publisher = self._cfx_handle.publish_subscription("TCI_TINCAN_MSG_NOTIFY")
         self.register_cbt("Logger", "LOG_QUERY_CONFIG")
-        self.log("LOG_INFO", "Module loaded")
+        return True
+
+    def _close_control_connection(self):
+        self.log("LOG_WARNING", "Tincan closed the control connection")
+        sock = self._sock
+        self._sock = self._sock_svr = None
+        sock.close()
+        # a restarted Tincan has no record of them, they are failed rather than left to expire
+        self._fail_inflight_requests("Tincan closed the control connection")
+
+    def _connect_control_async(self):
+        # asyncio engine counterpart of the listener's connection loop
+        loop = self._cfx_handle.event_loop
+        if self._open_control_connection():
+            loop.add_reader(self._sock_svr.fileno(), self._read_control_connection)
+        else:
+            loop.call_later(self._connect_retry_interval, self._connect_control_async)
 
     def __tincan_listener(self):
+        # one byte over the max read size to detect a message that did not fit
+        buf = bytearray(self._max_read_size + 1)
+        view = memoryview(buf)
+        while True:
+            if self._sock_type == socket.SOCK_SEQPACKET and \
+                not self._open_control_connection():
+                time.sleep(self._connect_retry_interval)
+                continue
+            self.__read_tincan_socket(buf, view)
+
+    def __read_tincan_socket(self, buf, view):
+        """
+        Drains every datagram queued on the socket each time it becomes readable, into a
+        preallocated buffer, and hands the payloads to the decoders so that the socket is
+        never left waiting on message processing. Returns when the seqpacket connection
+        closes.
+        """
+        flags = 0
+        if self._sock_type == socket.SOCK_SEQPACKET:
+            # the connection is also used for sending, which must remain blocking
+            flags = socket.MSG_DONTWAIT
+        else:
+            self._sock_svr.setblocking(False)
+        sel = selectors.DefaultSelector()
+        sel.register(self._sock_svr, selectors.EVENT_READ)
+        while True:
+            try:
+                if not sel.select(self._cm_config["SocketReadWaitTime"]):
+                    continue
+                while True:
+                    try:
+                        nbytes = self._sock_svr.recv_into(buf, 0, flags)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    except ConnectionError:
+                        if self._sock_type != socket.SOCK_SEQPACKET:
+                            raise
+                        nbytes = 0
+                    if nbytes == 0 and self._sock_type == socket.SOCK_SEQPACKET:
+                        sel.close()
+                        self._close_control_connection()
+                        return
+                    if nbytes > self._max_read_size:
+                        self.log("LOG_WARNING", "Dropped a Tincan message larger than %s bytes",
+                                 self._max_read_size)
+                        continue
+                    data = bytes(view[:nbytes])
+                    # classified without decoding, anything that may carry a notification
+                    # keeps to the ordered queue
+                    if b"TincanResponse" in data and b"TincanRequest" not in data:
+                        self._response_queue.put(data)
+                    else:
+                        self._notify_queue.put(data)
+            except Exception as err:
+                self.log("LOG_WARNING", "Tincan Listener exception:%s\n%s", err,
+                         traceback.format_exc())
+                time.sleep(0.1)
+
+    def __tincan_decoder(self, decode_queue):
+        while True:
+            data = decode_queue.get()
+            try:
+                self._process_tincan_datagram(data)
+            except Exception as err:
+                self.log("LOG_WARNING", "Tincan datagram exception:%s\n%s", err,
+                         traceback.format_exc())
+
+    def _read_control_connection(self):
+        # asyncio engine reader for the seqpacket transport, each read is one whole message
+        try:
+            data = self._sock_svr.recv(self._max_read_size, socket.MSG_DONTWAIT)
+        except (BlockingIOError, InterruptedError):
+            return
+        except ConnectionError:
+            data = b""
+        if not data:
+            loop = self._cfx_handle.event_loop
+            loop.remove_reader(self._sock_svr.fileno())
+            self._close_control_connection()
+            loop.call_later(self._connect_retry_interval, self._connect_control_async)
+            return
         try:
-            while True:
-                socks, _, _ = select.select(self._sock_list, [], [],
-                                            self._cm_config["SocketReadWaitTime"])
-                # Iterate across all socket list to obtain Tincan messages
-                for sock in socks:
-                    if sock == self._sock_svr:
-                        data = sock.recvfrom(self._cm_config["MaxReadSize"])
-                        ctl = json.loads(data[0].decode("utf-8"))
-                        if ctl["IPOP"]["ProtocolVersion"] != 5:
-                            raise ValueError("Invalid control version detected")
-                        # Get the original CBT if this is the response
-                        if ctl["IPOP"]["ControlType"] == "TincanResponse":
-                            cbt = self._cfx_handle._pending_cbts[ctl["IPOP"]["TransactionId"]]
-                            cbt.set_response(ctl["IPOP"]["Response"]["Message"],
-                                             ctl["IPOP"]["Response"]["Success"])
-                            self.complete_cbt(cbt)
-                        else:
-                            self._tci_publisher.post_update(ctl["IPOP"]["Request"])
+            self._process_tincan_datagram(data)
         except Exception as err:
-            log_cbt = self.register_cbt(
-                "Logger", "LOG_WARNING", "Tincan Listener exception:{0}\n"
-                "{1}".format(err, traceback.format_exc()))
-            self.submit_cbt(log_cbt)
+            self.log("LOG_WARNING", "Tincan datagram exception:%s\n%s", err,
+                     traceback.format_exc())
+
+    def _process_tincan_datagram(self, data):
+        ctl = tincanlib.decode(data)
+        if isinstance(ctl, list):
+            # a batch, an array of control messages in one datagram
+            for msg in ctl:
+                self._process_tincan_control(msg)
+        else:
+            self._process_tincan_control(ctl)
+
+    def _process_tincan_control(self, ctl):
+        if ctl["IPOP"]["ProtocolVersion"] not in (tincanlib.PROTOCOL_VERSION,
+                                                  tincanlib.BINARY_PROTOCOL_VERSION):
+            raise ValueError("Invalid control version detected")
+        # Get the original CBT if this is the response
+        if ctl["IPOP"]["ControlType"] == "TincanResponse":
+            cbt = self._pop_inflight_request(ctl["IPOP"]["TransactionId"])
+            if cbt is None:
+                # typically the answer to a request that was retransmitted or has expired
+                self.log("LOG_DEBUG", "No pending CBT for Tincan response %s",
+                         ctl["IPOP"]["TransactionId"])
+                return
+            if (cbt.request.action == "TCI_CREATE_CTRL_LINK"
+                    and ctl["IPOP"]["ProtocolVersion"] == tincanlib.BINARY_PROTOCOL_VERSION
+                    and ctl["IPOP"]["Response"]["Success"]):
+                # Tincan accepted the binary framing, subsequent requests use it
+                self._framing = tincanlib.FRAMING_MSGPACK
+            cbt.set_response(ctl["IPOP"]["Response"]["Message"],
+                             ctl["IPOP"]["Response"]["Success"])
+            self.complete_cbt(cbt)
+        else:
+            self._tci_publisher.post_update(ctl["IPOP"]["Request"])
 
     def create_control_link(self,):
         self.register_cbt("Logger", "LOG_INFO", "Creating Tincan control link")
         cbt = self.create_cbt(self._module_name, self._module_name, "TCI_CREATE_CTRL_LINK")
-        ctl = ipoplib.CTL_CREATE_CTRL_LINK
-        ctl["IPOP"]["TransactionId"] = cbt.tag
-        if self._cm_config["CtrlRecvPort"] is not None:
-            ctl["IPOP"]["Request"]["Port"] = self._cm_config["CtrlRecvPort"]
-        ctl["IPOP"]["Request"]["AddressFamily"] = "af_inet"
-        ctl["IPOP"]["Request"]["IP"] = self._cm_config["RcvServiceAddress"]
-        self._cfx_handle._pending_cbts[cbt.tag] = cbt
-        self.send_control(json.dumps(ctl))
+        if self._transport != "unix":
+            params = {"AddressFamily": "af_inet", "IP": self._cm_config["RcvServiceAddress"],
+                      "Port": self._cm_config["CtrlRecvPort"]}
+        elif self._sock_type == socket.SOCK_SEQPACKET:
+            # Tincan responds on the connection the request arrived on
+            params = {"AddressFamily": "af_unix", "Protocol": "proto_seqpacket"}
+        else:
+            params = {"AddressFamily": "af_unix", "Path": self._cm_config["CtrlRecvPath"]}
+        framing = self._cm_config.get("Framing", tincanlib.FRAMING_JSON)
+        if framing not in tincanlib.FRAMINGS:
+            self.log("LOG_WARNING", "Tincan control framing %s is unavailable, using JSON",
+                     framing)
+        elif framing != tincanlib.FRAMING_JSON:
+            params["Framing"] = framing
+        self._send_request(cbt, "TCI_CREATE_CTRL_LINK", params, tincanlib.FRAMING_JSON)
 
+    @response_handler("TCI_CREATE_CTRL_LINK")
     def resp_handler_create_control_link(self, cbt):
         if cbt.response.status == "False":
             msg = "Failed to create Tincan response link: CBT={0}".format(cbt)
             raise RuntimeError(msg)
+        self.free_cbt(cbt)
 
     def configure_tincan_logging(self, log_cfg, use_defaults=False):
         cbt = self.create_cbt(self._module_name, self._module_name, "TCI_CONFIGURE_LOGGING")
-        ctl = ipoplib.CTL_CONFIGURE_LOGGING
-        ctl["IPOP"]["TransactionId"] = cbt.tag
-        if not use_defaults:
-            ctl["IPOP"]["Request"]["Level"] = log_cfg["LogLevel"]
-            ctl["IPOP"]["Request"]["Device"] = log_cfg["Device"]
-            ctl["IPOP"]["Request"]["Directory"] = log_cfg["Directory"]
-            ctl["IPOP"]["Request"]["Filename"] = log_cfg["TincanLogFileName"]
-            ctl["IPOP"]["Request"]["MaxArchives"] = log_cfg["MaxArchives"]
-            ctl["IPOP"]["Request"]["MaxFileSize"] = log_cfg["MaxFileSize"]
-            ctl["IPOP"]["Request"]["ConsoleLevel"] = log_cfg["ConsoleLevel"]
-        self._cfx_handle._pending_cbts[cbt.tag] = cbt
-        self.send_control(json.dumps(ctl))
+        self._send_request(cbt, "TCI_CONFIGURE_LOGGING", None if use_defaults else log_cfg)
 
+    @response_handler("TCI_CONFIGURE_LOGGING")
     def resp_handler_configure_tincan_logging(self, cbt):
         if cbt.response.status == "False":
             msg = "Failed to configure Tincan logging: CBT={0}".format(cbt)
             self.register_cbt("Logger", "LOG_WARNING", msg)
+        self.free_cbt(cbt)
+
+    @response_handler("LOG_QUERY_CONFIG")
+    def resp_handler_query_log_config(self, cbt):
+        self.configure_tincan_logging(cbt.response.data, not cbt.response.status)
+        self.free_cbt(cbt)
 
+    @request_handler("TCI_CREATE_LINK")
     def req_handler_create_link(self, cbt):
-        msg = cbt.request.params
-        ctl = ipoplib.CTL_CREATE_LINK
-        ctl["IPOP"]["TransactionId"] = cbt.tag
-        req = ctl["IPOP"]["Request"]
-        req["OverlayId"] = msg["OverlayId"]
-        req["TunnelId"] = msg["TunnelId"]
-        req["NodeId"] = msg.get("NodeId")
-        req["LinkId"] = msg["LinkId"]
-        req["PeerInfo"]["UID"] = msg["NodeData"].get("UID")
-        req["PeerInfo"]["MAC"] = msg["NodeData"].get("MAC")
-        req["PeerInfo"]["CAS"] = msg["NodeData"].get("CAS")
-        req["PeerInfo"]["FPR"] = msg["NodeData"].get("FPR")
-        # Optional overlay data to create overlay on demand
-        req["StunServers"] = msg.get("StunServers")
-        req["TurnServers"] = msg.get("TurnServers")
-        req["Type"] = msg["Type"]
-        req["TapName"] = msg.get("TapName")
-        req["IgnoredNetInterfaces"] = msg.get("IgnoredNetInterfaces")
-        self.send_control(json.dumps(ctl))
+        self._send_request(cbt, "TCI_CREATE_LINK", cbt.request.params)
 
+    @request_handler("TCI_CREATE_TUNNEL")
     def req_handler_create_tunnel(self, cbt):
-        msg = cbt.request.params
-        ctl = ipoplib.CTL_CREATE_TUNNEL
-        ctl["IPOP"]["TransactionId"] = cbt.tag
-        req = ctl["IPOP"]["Request"]
-        req["StunServers"] = msg["StunServers"]
-        req["TurnServers"] = msg.get("TurnServers")
-        req["Type"] = msg["Type"]
-        req["TapName"] = msg["TapName"]
-        req["OverlayId"] = msg["OverlayId"]
-        req["TunnelId"] = msg["TunnelId"]
-        req["NodeId"] = msg.get("NodeId")
-        req["IgnoredNetInterfaces"] = msg.get("IgnoredNetInterfaces")
-        self.send_control(json.dumps(ctl))
+        self._send_request(cbt, "TCI_CREATE_TUNNEL", cbt.request.params)
 
+    @request_handler("TCI_QUERY_CAS")
     def req_handler_query_candidate_address_set(self, cbt):
-        msg = cbt.request.params
-        ctl = ipoplib.CTL_QUERY_CAS
-        ctl["IPOP"]["TransactionId"] = cbt.tag
-        req = ctl["IPOP"]["Request"]
-        req["OverlayId"] = msg["OverlayId"]
-        req["LinkId"] = msg["LinkId"]
-        self.send_control(json.dumps(ctl))
+        self._send_request(cbt, "TCI_QUERY_CAS", cbt.request.params)
 
+    @request_handler("TCI_QUERY_LINK_STATS")
     def req_handler_query_link_stats(self, cbt):
-        msg = cbt.request.params
-        ctl = ipoplib.CTL_QUERY_LINK_STATS
-        ctl["IPOP"]["TransactionId"] = cbt.tag
-        req = ctl["IPOP"]["Request"]
-        req["TunnelIds"] = msg
-        self.send_control(json.dumps(ctl))
+        self._send_request(cbt, "TCI_QUERY_LINK_STATS", cbt.request.params)
 
+    @request_handler("TCI_QUERY_TUNNEL_INFO")
     def req_handler_query_tunnel_info(self, cbt):
-        msg = cbt.request.params
-        ctl = ipoplib.CTL_QUERY_TUNNEL_INFO
-        ctl["IPOP"]["TransactionId"] = cbt.tag
-        req = ctl["IPOP"]["Request"]
-        req["OverlayId"] = msg["OverlayId"]
-        self.send_control(json.dumps(ctl))
+        self._send_request(cbt, "TCI_QUERY_TUNNEL_INFO", cbt.request.params)
 
+    @request_handler("TCI_REMOVE_TUNNEL")
     def req_handler_remove_tunnel(self, cbt):
         msg = cbt.request.params
-        ctl = ipoplib.CTL_REMOVE_TUNNEL
-        ctl["IPOP"]["TransactionId"] = cbt.tag
-        req = ctl["IPOP"]["Request"]
-        req["OverlayId"] = msg["OverlayId"]
-        req["TunnelId"] = msg["TunnelId"]
-        self.send_control(json.dumps(ctl))
+        self._send_request(cbt, "TCI_REMOVE_TUNNEL", msg)
         if "TapName" in msg and msg["TapName"]:
-            ipoplib.runshell([self.iptool, "link", "del", "dev", msg["TapName"]])
+            cmd = [self.iptool, "link", "del", "dev", msg["TapName"]]
+            loop = self._cfx_handle.event_loop
+            if loop is None:
+                ipoplib.runshell(cmd)
+            else:
+                # the subprocess would otherwise block the event loop shared by all modules
+                loop.run_in_executor(None, ipoplib.runshell, cmd)
 
+    @request_handler("TCI_REMOVE_LINK")
     def req_handler_remove_link(self, cbt):
-        msg = cbt.request.params
-        ctl = ipoplib.CTL_REMOVE_LINK
-        ctl["IPOP"]["TransactionId"] = cbt.tag
-        req = ctl["IPOP"]["Request"]
-        req["OverlayId"] = msg["OverlayId"]
-        req["TunnelId"] = msg["TunnelId"]
-        req["LinkId"] = msg["LinkId"]
-        self.send_control(json.dumps(ctl))
+        self._send_request(cbt, "TCI_REMOVE_LINK", cbt.request.params)
 
-    def process_cbt(self, cbt):
-        if cbt.op_type == "Request":
-            if cbt.request.action == "TCI_CREATE_LINK":
-                self.req_handler_create_link(cbt)
+    @request_handler("TCI_QUERY_INFLIGHT_STATS")
+    def req_handler_query_inflight_stats(self, cbt):
+        cbt.set_response(self.inflight_stats(), True)
+        self.complete_cbt(cbt)
 
-            elif cbt.request.action == "TCI_REMOVE_LINK":
-                self.req_handler_remove_link(cbt)
+    def inflight_stats(self):
+        """ Returns the counters and response times of the requests sent to Tincan """
+        now = time.time()
+        with self._inflight_lck:
+            stats = dict(self._inflight_stats)
+            stats["Outstanding"] = len(self._inflight)
+            stats["OldestAge"] = max((now - req.time_sent for req in self._inflight.values()),
+                                     default=0.0)
+            stats["ResponseTime"] = self._response_time.snapshot()
+        return stats
 
-            elif cbt.request.action == "TCI_CREATE_TUNNEL":
-                self.req_handler_create_tunnel(cbt)
+    def _send_request(self, cbt, action, params, framing=None):
+        msg = tincanlib.encode(action, cbt.tag, params,
+                               self._framing if framing is None else framing)
+        # tracked before it is sent so that a prompt response always finds it
+        if not self._add_inflight_request(cbt, action, msg):
+            cbt.set_response("Too many outstanding Tincan requests", False)
+            self.complete_cbt(cbt)
+            return
+        try:
+            self.send_control(msg)
+        except OSError as err:
+            if self._sock_type == socket.SOCK_SEQPACKET:
+                # it did not reach Tincan and nothing will resend it, the lost connection
+                # has already been reported
+                self._fail_inflight_request(cbt.tag, "Not connected to Tincan")
+                return
+            # left in flight, it is retransmitted or expires like a lost datagram
+            self.log("LOG_WARNING", "Tincan control send failed:%s", err)
 
-            elif cbt.request.action == "TCI_QUERY_CAS":
-                self.req_handler_query_candidate_address_set(cbt)
+    def _add_inflight_request(self, cbt, action, msg):
+        now = time.time()
+        with self._inflight_lck:
+            if len(self._inflight) >= self._max_inflight:
+                self._inflight_stats["Rejected"] += 1
+                return False
+            # a request is only resent when the transport can lose it and Tincan is
+            # unaffected by receiving it twice
+            if (self._sock_type == socket.SOCK_SEQPACKET or
+                    action not in tincanlib.IDEMPOTENT_ACTIONS):
+                self._inflight.add(cbt.tag, InFlightRequest(cbt, msg, now, 0),
+                                   now + self._request_expiry)
+            else:
+                self._inflight.add(cbt.tag, InFlightRequest(cbt, msg, now, self._max_retransmits),
+                                   now + self._retransmit_timeout)
+            self._inflight_stats["Sent"] += 1
+            if len(self._inflight) > self._inflight_stats["MaxOutstanding"]:
+                self._inflight_stats["MaxOutstanding"] = len(self._inflight)
+        # Tincan's response is correlated here, it supersedes the CFx pending entry
+        self._cfx_handle.pop_pending_cbt(cbt.tag)
+        return True
 
-            elif cbt.request.action == "TCI_QUERY_LINK_STATS":
-                self.req_handler_query_link_stats(cbt)
+    def _pop_inflight_request(self, tag):
+        with self._inflight_lck:
+            req = self._inflight.pop(tag, None)
+            if req is None:
+                self._inflight_stats["LateResponses"] += 1
+                return None
+            self._response_time.record(time.time() - req.time_sent)
+        return req.cbt
 
-            elif cbt.request.action == "TCI_QUERY_TUNNEL_INFO":
-                self.req_handler_query_tunnel_info(cbt)
+    def _fail_inflight_request(self, tag, msg):
+        with self._inflight_lck:
+            req = self._inflight.pop(tag, None)
+        if req is not None:
+            req.cbt.set_response(msg, False)
+            self.complete_cbt(req.cbt)
 
-            elif cbt.request.action == "TCI_REMOVE_TUNNEL":
-                self.req_handler_remove_tunnel(cbt)
+    def _fail_inflight_requests(self, msg):
+        with self._inflight_lck:
+            reqs = self._inflight.values()
+            self._inflight.clear()
+        for req in reqs:
+            req.cbt.set_response(msg, False)
+            self.complete_cbt(req.cbt)
 
-            else:
-                self.req_handler_default(cbt)
-        elif cbt.op_type == "Response":
-            if cbt.request.action == "LOG_QUERY_CONFIG":
-                self.configure_tincan_logging(cbt.response.data,
-                                              not cbt.response.status)
+    def _expire_inflight_requests(self):
+        """
+        Retransmits the idempotent requests whose response is overdue, doubling the wait each
+        time, and fails those that have exhausted their retransmissions or cannot be resent.
+        """
+        resend = []
+        expired = []
+        now = time.time()
+        with self._inflight_lck:
+            for tag, req in self._inflight.pop_expired(now):
+                if req.retransmits < req.max_retransmits:
+                    req.retransmits += 1
+                    self._inflight.add(tag, req,
+                                       now + self._retransmit_timeout * 2 ** req.retransmits)
+                    resend.append(req.msg)
+                else:
+                    expired.append(req.cbt)
+            self._inflight_stats["Retransmitted"] += len(resend)
+            self._inflight_stats["TimedOut"] += len(expired)
+        for msg in resend:
+            try:
+                self.send_control(msg)
+            except OSError as err:
+                self.log("LOG_WARNING", "Tincan control send failed:%s", err)
+        for cbt in expired:
+            self.log("LOG_WARNING", "Tincan did not respond to %s", cbt.request.action)
+            cbt.set_response("Tincan did not respond to the request", False)
+            self.complete_cbt(cbt)
 
-            elif cbt.request.action == "TCI_CREATE_CTRL_LINK":
-                self.resp_handler_create_control_link(cbt)
+    def send_control(self, msg):
+        # msg is the encoded control message
+        if self._send_queue is not None:
+            self._send_queue.put(msg)
+            return len(msg)
+        return self._transmit(msg)
 
-            elif cbt.request.action == "TCI_CONFIGURE_LOGGING":
-                self.resp_handler_configure_tincan_logging(cbt)
+    def _transmit(self, data):
+        if self._dest is None:
+            sock = self._sock
+            if sock is None:
+                raise ConnectionError("Not connected to Tincan")
+            return sock.send(data)
+        return self._sock.sendto(data, self._dest)
 
-            self.free_cbt(cbt)
+    def __tincan_sender(self):
+        # packs the control messages queued within the batch window into a single datagram,
+        # a None message flushes the current batch and stops the sender
+        carried = None
+        stop = False
+        while not stop:
+            msg = carried if carried is not None else self._send_queue.get()
+            carried = None
+            if msg is None:
+                break
+            batch = [msg]
+            size = len(msg) + 2
+            deadline = time.time() + self._batch_window
+            while len(batch) < self._max_batch_size:
+                try:
+                    msg = self._send_queue.get(timeout=max(deadline - time.time(), 0))
+                except queue.Empty:
+                    break
+                if msg is None:
+                    stop = True
+                    break
+                if size + len(msg) + 1 > self._max_batch_bytes:
+                    carried = msg
+                    break
+                batch.append(msg)
+                size += len(msg) + 1
+            try:
+                self._send_batch(batch)
+            except OSError as err:
+                self.log("LOG_WARNING", "Tincan control send failed:%s", err)
 
-    def send_control(self, msg):
-        return self._sock.sendto(bytes(msg.encode("utf-8")), self._dest)
+    def _send_batch(self, batch):
+        # a batch straddling the switch of framing is sent as one datagram per framing
+        for _, msgs in itertools.groupby(batch, tincanlib.is_binary):
+            self._transmit(tincanlib.join(list(msgs)))
 
     def timer_method(self):
         pass
 
     def terminate(self):
-        pass
+        self._cfx_handle.cancel_timer(self._inflight_timer)
+        if self._tincan_sender_thread is not None:
+            self._send_queue.put(None)
+            self._tincan_sender_thread.join()
+        if self._transport == "unix" and self._sock_type == socket.SOCK_DGRAM:
+            try:
+                os.unlink(self._cm_config["CtrlRecvPath"])
+            except OSError:
+                pass
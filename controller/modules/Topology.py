@@ -20,11 +20,11 @@
 # THE SOFTWARE.
 import math
 import random
-import threading
 import time
 from datetime import datetime
 from controller.framework.CFx import CFX
-from controller.framework.ControllerModule import ControllerModule
+from controller.framework.ControllerModule import ControllerModule, LazyArg
+from controller.framework.ControllerModule import request_handler, response_handler
 from controller.modules.NetworkBuilder import NetworkBuilder
 from controller.modules.NetworkBuilder import EdgeRequest
 from controller.modules.NetworkBuilder import EdgeResponse
@@ -77,7 +77,6 @@ class Topology(ControllerModule, CFX):
     def __init__(self, cfx_handle, module_config, module_name):
         super(Topology, self).__init__(cfx_handle, module_config, module_name)
         self._net_ovls = {}
-        self._lock = threading.Lock()
         self._topo_changed_publisher = None
 
     def __repr__(self):
@@ -91,9 +90,16 @@ class Topology(ControllerModule, CFX):
         return state
 
     def initialize(self):
-        self._topo_changed_publisher = self._cfx_handle.publish_subscription("TOP_TOPOLOGY_CHANGE")
+        self._topo_changed_publisher = self._cfx_handle.publish_subscription(
+            "TOP_TOPOLOGY_CHANGE", no_response=True)
         self._cfx_handle.start_subscription("Signal", "SIG_PEER_PRESENCE_NOTIFY")
-        self._cfx_handle.start_subscription("LinkManager", "LNK_TUNNEL_EVENTS")
+        coalesce = None
+        if self.config.get("TunnelEventCoalesceWindow", 0) > 0:
+            # a flapping set of tunnels is then handled in one pass per overlay
+            coalesce = {"Keys": ["OverlayId", "PeerId"],
+                        "Window": self.config["TunnelEventCoalesceWindow"]}
+        self._cfx_handle.start_subscription("LinkManager", "LNK_TUNNEL_EVENTS",
+                                            coalesce=coalesce)
         nid = self.node_id
         for olid in self._cfx_handle.query_param("Overlays"):
             max_wrk_ld = int(self.config["Overlays"][olid].get("MaxConcurrentEdgeSetup", 3))
@@ -115,6 +121,7 @@ class Topology(ControllerModule, CFX):
     def terminate(self):
         pass
 
+    @response_handler("LNK_CREATE_TUNNEL")
     def resp_handler_create_tnl(self, cbt):
         params = cbt.request.params
         olid = params["OverlayId"]
@@ -125,6 +132,7 @@ class Topology(ControllerModule, CFX):
             self._net_ovls[olid]["KnownPeers"][peer_id].exclude()
         self.free_cbt(cbt)
 
+    @response_handler("LNK_REMOVE_TUNNEL")
     def resp_handler_remove_tnl(self, cbt):
         if not cbt.response.status:
             self.register_cbt("Logger", "LOG_WARNING",
@@ -136,6 +144,7 @@ class Topology(ControllerModule, CFX):
             self._net_ovls[olid]["NetBuilder"].update_edge_state(params)
         self.free_cbt(cbt)
 
+    @request_handler("SIG_PEER_PRESENCE_NOTIFY")
     def req_handler_peer_presence(self, cbt):
         """
         Handles peer presence notification. Determines when to build a new graph and refresh
@@ -164,6 +173,7 @@ class Topology(ControllerModule, CFX):
         cbt.set_response(None, True)
         self.complete_cbt(cbt)
 
+    @request_handler("VIS_DATA_REQ")
     def req_handler_vis_data(self, cbt):
         topo_data = {}
         try:
@@ -196,8 +206,25 @@ class Topology(ControllerModule, CFX):
             self.register_cbt("Logger", "LOG_WARNING", "Topology data not available {0}".
                               format(cbt.response.data))
 
+    @request_handler("LNK_TUNNEL_EVENTS")
     def req_handler_tnl_data_update(self, cbt):
         params = cbt.request.params
+        if isinstance(params, (list, tuple)):
+            # a coalesced batch, each overlay is updated once all of its events are applied
+            olids = []
+            for event in params:
+                self._apply_tunnel_event(event)
+                if event["OverlayId"] not in olids:
+                    olids.append(event["OverlayId"])
+        else:
+            self._apply_tunnel_event(params)
+            olids = [params["OverlayId"]]
+        for olid in olids:
+            self._update_overlay(olid)
+        cbt.set_response(None, True)
+        self.complete_cbt(cbt)
+
+    def _apply_tunnel_event(self, params):
         olid = params["OverlayId"]
         peer_id = params["PeerId"]
         if params["UpdateType"] == "LnkEvAuthorized":
@@ -216,17 +243,15 @@ class Topology(ControllerModule, CFX):
         elif params["UpdateType"] == "LnkEvDeauthorized":
             self._net_ovls[olid]["KnownPeers"][peer_id].exclude()
             self.log("LOG_DEBUG", "Excluding peer %s until %s", peer_id,
-                     str(datetime.fromtimestamp(
-                             self._net_ovls[olid]["KnownPeers"][peer_id].available_time)))
+                     datetime.fromtimestamp(
+                         self._net_ovls[olid]["KnownPeers"][peer_id].available_time))
         elif params["UpdateType"] == "LnkEvRemoved":
             self._do_topo_change_post(olid)
         else:
             self.log("LOG_WARNING", "Unknown link update type: %s", params["UpdateType"])
         self._net_ovls[olid]["NetBuilder"].update_edge_state(params)
-        self._update_overlay(olid)
-        cbt.set_response(None, True)
-        self.complete_cbt(cbt)
 
+    @request_handler("TOP_REQUEST_OND_TUNNEL")
     def req_handler_req_ond_tunnel(self, cbt):
         """
         Add the request params for creating an on demand tunnel
@@ -244,6 +269,7 @@ class Topology(ControllerModule, CFX):
             self.register_cbt("Logger", "LOG_WARNING", "Invalid on-demand tunnel request "
                               "parameter, OverlayId={0}, PeerId={1}".format(olid, peer_id))
 
+    @request_handler("TOP_NEGOTIATE_EDGE")
     def req_handler_negotiate_edge(self, edge_cbt):
         """ Role B, decide if the request for an incoming edge is accepted or rejected """
         edge_req = EdgeRequest(**edge_cbt.request.params)
@@ -274,6 +300,7 @@ class Topology(ControllerModule, CFX):
             edge_cbt.set_response(edge_resp.data, False)
             self.complete_cbt(edge_cbt)
 
+    @response_handler("LNK_AUTH_TUNNEL")
     def resp_handler_auth_tunnel(self, cbt):
         """ Role B
             LNK auth completed, add the CE to Netbuilder and send response to initiator ie., Role A
@@ -293,6 +320,7 @@ class Topology(ControllerModule, CFX):
         nego_cbt.set_response(edge_resp.data, edge_resp.is_accepted)
         self.complete_cbt(nego_cbt)
 
+    @response_handler("SIG_REMOTE_ACTION")
     def resp_handler_remote_action(self, cbt):
         """ Role Node A, initiate edge creation on successful neogtiation """
         rem_act = RemoteAction.from_cbt(cbt)
@@ -317,39 +345,6 @@ class Topology(ControllerModule, CFX):
             self.register_cbt("Logger", "LOG_WARNING", "Unrecognized remote action {0}"
                               .format(rem_act.action))
 
-    def process_cbt(self, cbt):
-        with self._lock:
-            if cbt.op_type == "Request":
-                if cbt.request.action == "SIG_PEER_PRESENCE_NOTIFY":
-                    self.req_handler_peer_presence(cbt)
-                elif cbt.request.action == "VIS_DATA_REQ":
-                    self.req_handler_vis_data(cbt)
-                elif cbt.request.action == "LNK_TUNNEL_EVENTS":
-                    self.req_handler_tnl_data_update(cbt)
-                elif cbt.request.action == "TOP_REQUEST_OND_TUNNEL":
-                    self.req_handler_req_ond_tunnel(cbt)
-                elif cbt.request.action == "TOP_NEGOTIATE_EDGE":
-                    self.req_handler_negotiate_edge(cbt)
-                else:
-                    self.req_handler_default(cbt)
-            elif cbt.op_type == "Response":
-                if cbt.request.action == "LNK_CREATE_TUNNEL":
-                    self.resp_handler_create_tnl(cbt)
-                elif cbt.request.action == "LNK_REMOVE_TUNNEL":
-                    self.resp_handler_remove_tnl(cbt)
-                elif cbt.request.action == "SIG_REMOTE_ACTION":
-                    self.resp_handler_remote_action(cbt)
-                elif cbt.request.action == "LNK_AUTH_TUNNEL":
-                    self.resp_handler_auth_tunnel(cbt)
-                else:
-                    parent_cbt = cbt.parent
-                    cbt_data = cbt.response.data
-                    cbt_status = cbt.response.status
-                    self.free_cbt(cbt)
-                    if (parent_cbt is not None and parent_cbt.child_count == 1):
-                        parent_cbt.set_response(cbt_data, cbt_status)
-                        self.complete_cbt(parent_cbt)
-
     def _manage_topology(self):
         # Periodically refresh the topology, making sure desired links exist and exipred ones are
         # removed.
@@ -357,9 +352,8 @@ class Topology(ControllerModule, CFX):
             self._update_overlay(olid)
 
     def timer_method(self):
-        with self._lock:
-            self._manage_topology()
-            self.log("LOG_INFO", "State=%s", str(self))
+        self._manage_topology()
+        self.log("LOG_INFO", "State=%s", LazyArg(str, self))
 
     def top_add_edge(self, overlay_id, peer_id, edge_id):
         """
@@ -407,8 +401,7 @@ class Topology(ControllerModule, CFX):
                 if net_ovl["KnownPeers"][peer_id].is_available]
             if not peer_list:
                 return
-            self.register_cbt("Logger", "LOG_DEBUG", "Peerlist for Netbuilder {0}"
-                              .format(peer_list))
+            self.log("LOG_DEBUG", "Peerlist for Netbuilder %s", peer_list)
 
             max_succ = int(ovl_cfg.get("MaxSuccessors", 1))
             max_ond = int(ovl_cfg.get("MaxOnDemandEdges", 2))
@@ -21,13 +21,13 @@
 
 import datetime
 import hashlib
-import threading
 try:
     import simplejson as json
 except ImportError:
     import json
 import urllib.request as urllib2
 from controller.framework.ControllerModule import ControllerModule
+from controller.framework.ControllerModule import response_handler
 
 
 class UsageReport(ControllerModule):
@@ -35,45 +35,30 @@ class UsageReport(ControllerModule):
         super(UsageReport, self).__init__(cfx_handle, module_config, module_name)
         self._stat_data = {"ready": False, "pending_request": False}
         self.submit_time = datetime.datetime(2015, 1, 1, 0, 0)
-        self.lck = threading.Lock()
 
     def initialize(self):
         self.register_cbt("Logger", "LOG_INFO", "{0} Loaded".format(self._module_name))
 
-    def process_cbt(self, cbt):
-        if cbt.op_type == "Response":
-            if cbt.request.action == "SIG_QUERY_REPORTING_DATA":
-                if not cbt.response.status:
-                    self.register_cbt("Logger", "LOG_WARNING",
-                                      "CBT failed {0}".format(cbt.response.data))
-                    self.free_cbt(cbt)
-                else:
-                    self.create_report(cbt)
-            else:
-                parent_cbt = cbt.parent
-                cbt_data = cbt.response.data
-                cbt_status = cbt.response.status
-                self.free_cbt(cbt)
-                if (parent_cbt is not None and parent_cbt.child_count == 1):
-                    parent_cbt.set_response(cbt_data, cbt_status)
-                    self.complete_cbt(parent_cbt)
+    @response_handler("SIG_QUERY_REPORTING_DATA")
+    def resp_handler_query_reporting_data(self, cbt):
+        if not cbt.response.status:
+            self.register_cbt("Logger", "LOG_WARNING",
+                              "CBT failed {0}".format(cbt.response.data))
+            self.free_cbt(cbt)
         else:
-            self.req_handler_default(cbt)
+            self.create_report(cbt)
 
     def timer_method(self):
         cur_time = datetime.datetime.now()
-        self.lck.acquire()
         if self._stat_data["ready"]:
             data = self._stat_data["data"]
             self._stat_data = {}
             self._stat_data["ready"] = False
             self._stat_data["pending_request"] = False
-            self.lck.release()
             self.submit_report(data)
             self.submit_time = datetime.datetime.now()
         elif not self._stat_data["pending_request"] and cur_time > self.submit_time:
             self._stat_data["pending_request"] = True
-            self.lck.release()
             self.request_report()
 
     def terminate(self):
@@ -99,11 +84,9 @@ class UsageReport(ControllerModule):
             "Version": self._cfx_handle.query_param("IpopVersion")
         }
         stat.update(report_data)
-        self.lck.acquire()
         self._stat_data["data"] = stat
         self._stat_data["ready"] = True
         self._stat_data["pending_request"] = False
-        self.lck.release()
         self.free_cbt(cbt)
 
     def submit_report(self, report_data):